@@ -24,6 +24,7 @@ query SearchMostPopularJavaRepos($queryString: String!, $first: Int!, $after: St
         }
         url
         stargazerCount
+        diskUsage
         createdAt
         releases {
           totalCount
@@ -92,6 +93,7 @@ def busca_repos_java(count: int) -> List[Dict[str, Any]]:
                 "stars_count": node['stargazerCount'],
                 "releases_count": node['releases']['totalCount'],
                 "repo_age_years": calcula_idade_repo(node['createdAt']),
+                "disk_usage_kb": node['diskUsage'],
             }
             todos_repos.append(repo_info)
 
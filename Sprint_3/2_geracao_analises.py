@@ -1,11 +1,73 @@
 # 2_analyze_repos.py
+import argparse
+import multiprocessing
 import os
+import re
 import shutil
+import socket
 import stat
 import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 import pandas as pd
 from pathlib import Path
+import admissao
+import amostragem
+import cache_ck
 import config
+import fila_trabalho
+import perfil
+
+# Estimativas de consumo usadas pelo controle de admissão
+CLONE_PADRAO_MB = 1024
+CLONE_FATOR_DISCO = 2.5
+CLONE_RAM_MB = 256
+CK_HEAP_BASE_MB = 512
+CK_HEAP_POR_MB_FONTE = 30
+
+# Watchdog do CK: encerra a JVM parada há muito tempo, mas deixa seguir quem está avançando
+CK_SEM_PROGRESSO = 180
+CK_PRAZO_MAXIMO = 3600
+CK_INTERVALO_VERIFICACAO = 5
+
+# Literais de string e caractere entram no padrão para que "//" e "/*" dentro deles não contem como comentário
+_TOKENS_JAVA = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*.*?\*/', re.DOTALL)
+# Dependências entre arquivos .java, lidas do código sem comentários e literais
+_PACOTE_JAVA = re.compile(r"\bpackage\s+([\w.]+)\s*;")
+_IMPORT_JAVA = re.compile(r"\bimport\s+(?:static\s+)?([\w.]+?)(?:\s*\.\s*\*)?\s*;")
+_DECLARACAO_JAVA = re.compile(r"\b(?:class|interface|enum|record)\s+(\w+)")
+_HERANCA_JAVA = re.compile(r"\b(?:extends|implements)\s+([^{;()]+)")
+_IDENTIFICADOR_JAVA = re.compile(r"\b[A-Za-z_$][\w$]*")
+
+
+class ErroClone(RuntimeError):
+    """Falha ou timeout no git clone."""
+
+
+class ErroCK(RuntimeError):
+    """O CK falhou ou não gerou resultados."""
+
+
+class CKSemProgresso(ErroCK):
+    """O watchdog encerrou o CK porque o log e a saída pararam de crescer."""
+
+
+class CKPrazoMaximo(ErroCK):
+    """O watchdog encerrou o CK por atingir o prazo máximo, mesmo avançando."""
+
+
+class CKSemMemoria(ErroCK):
+    """A JVM do CK morreu com OutOfMemoryError; pode ser reprocessada com um heap maior."""
+
+
+class ErroGit(RuntimeError):
+    """Falha em um comando git após o clone (listar revisões, criar worktree)."""
+
+
+class SemMetricas(RuntimeError):
+    """O CK rodou, mas não foi possível extrair métricas do 'class.csv'."""
 
 def remove_clone_repo(path_repo: Path):
     """Remove o diretório do repositório clonado para liberar espaço."""
@@ -23,8 +85,8 @@ def remove_clone_repo(path_repo: Path):
         print(f"  AVISO: Não foi possível remover o repositório {path_repo.name}. Erro: {e}")
 
 
-def clone_repo(repo_url: str, dest_folder: Path) -> Path:
-    """Clone com shallow"""
+def clone_repo(repo_url: str, dest_folder: Path, historico: bool = False) -> Path:
+    """Clone com shallow, ou sem blobs (com todo o histórico de commits) se `historico`."""
 
     nome_repo = repo_url.rstrip("/").split("/")[-1]
     path_repo = dest_folder / nome_repo
@@ -33,82 +95,203 @@ def clone_repo(repo_url: str, dest_folder: Path) -> Path:
         print(f"  Repositório '{nome_repo}' já existe. Pulando clone.")
         return path_repo
 
-    print(f"  Clonando {nome_repo} (shallow clone)...")
+    if historico:
+        # Blobless: commits e árvores completos, blobs baixados só para o checkout do HEAD
+        print(f"  Clonando {nome_repo} (blobless clone)...")
+        cmd = ["git", "clone", "--filter=blob:none", repo_url, str(path_repo)]
+    else:
+        print(f"  Clonando {nome_repo} (shallow clone)...")
+        cmd = ["git", "clone", "--depth", "1", repo_url, str(path_repo)]
     try:
-        subprocess.run(
-            ["git", "clone", "--depth", "1", repo_url, str(path_repo)],
-            check=True, capture_output=True, text=True, timeout=300
-        )
+        subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=300)
         return path_repo
     except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Falha ao clonar {nome_repo}: {e.stderr}")
+        raise ErroClone(f"Falha ao clonar {nome_repo}: {e.stderr}")
     except subprocess.TimeoutExpired:
-        raise RuntimeError(f"Timeout ao clonar {nome_repo}.")
+        raise ErroClone(f"Timeout ao clonar {nome_repo}.")
     
 
-def run_ck_analysis(path_repo: Path) -> bool:
-    """Executa a análise do CK em um repositório clonado e captura logs."""
-    shutil.rmtree(config.PATH_OUTPUT_CK, ignore_errors=True)
-    config.PATH_OUTPUT_CK.mkdir()
+def measure_ck_progress(log_file_path: Path, output_dir: Path) -> int:
+    """Bytes já escritos pelo CK no log e nos CSVs de saída; cresce enquanto há progresso."""
+    total = log_file_path.stat().st_size if log_file_path.exists() else 0
+    for arquivo in output_dir.glob("*.csv"):
+        try:
+            total += arquivo.stat().st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def supervise_ck_process(process: subprocess.Popen, log_file_path: Path, output_dir: Path,
+                         sem_progresso: float, prazo_max: float, ao_verificar=None):
+    """
+    Acompanha o CK até ele terminar. Retorna (None, None) se terminou sozinho, ou
+    (classe do erro, motivo) se foi encerrado por ficar sem progresso ou por estourar o prazo máximo.
+    `ao_verificar` é chamado a cada verificação (ex.: para renovar o lease da tarefa).
+    """
+    inicio = ultimo_progresso = time.monotonic()
+    progresso = 0
+    while True:
+        try:
+            process.wait(timeout=CK_INTERVALO_VERIFICACAO)
+            return None, None
+        except subprocess.TimeoutExpired:
+            pass
+        if ao_verificar:
+            ao_verificar()
+        agora = time.monotonic()
+        atual = measure_ck_progress(log_file_path, output_dir)
+        if atual > progresso:
+            progresso, ultimo_progresso = atual, agora
+
+        if agora - ultimo_progresso > sem_progresso:
+            erro = (CKSemProgresso, f"sem progresso há {agora - ultimo_progresso:.0f}s "
+                                    f"({progresso} bytes escritos em {agora - inicio:.0f}s)")
+        elif agora - inicio > prazo_max:
+            erro = (CKPrazoMaximo, f"prazo máximo de {prazo_max:.0f}s atingido "
+                                   f"({progresso} bytes escritos)")
+        else:
+            continue
+        process.kill()
+        process.wait()
+        return erro
+
+
+def ck_out_of_memory(log_file_path: Path) -> bool:
+    """Indica se o log do CK registra um OutOfMemoryError da JVM."""
+    try:
+        with open(log_file_path, errors="replace") as log_file:
+            return any("java.lang.OutOfMemoryError" in linha for linha in log_file)
+    except FileNotFoundError:
+        return False
+
+
+def run_ck_analysis(path_repo: Path, output_dir: Path = None, heap_mb: int = None, java_files: list = None,
+                    sem_progresso: float = CK_SEM_PROGRESSO, prazo_max: float = CK_PRAZO_MAXIMO,
+                    ao_verificar=None, log_file_path: Path = None) -> bool:
+    """
+    Executa a análise do CK em um repositório clonado e captura logs em `log_file_path`
+    (padrão: 'ck_logs/<repo>-ck.log'; com vários workers, passe um caminho por worker).
+    Levanta CKSemProgresso/CKPrazoMaximo se o watchdog precisar encerrar a JVM,
+    e CKSemMemoria se ela falhar por falta de heap.
+    `ao_verificar` é chamado periodicamente enquanto a JVM roda.
+    """
+    output_dir = output_dir or config.PATH_OUTPUT_CK
+    shutil.rmtree(output_dir, ignore_errors=True)
+    output_dir.mkdir(parents=True)
 
     print(f"  Executando CK em {path_repo.name}...")
-    java_files = list(path_repo.rglob("*.java"))
+    if java_files is None:
+        java_files = list(path_repo.rglob("*.java"))
     if not java_files:
         print("  AVISO: Nenhum arquivo .java encontrado.")
         return False
 
     cmd = [
         str(config.JAVA_PATH), "-jar", str(config.PATH_CK_JAR),
-        str(path_repo), "true", "0", "true", str(config.PATH_OUTPUT_CK)
+        str(path_repo), "true", "0", "true", str(output_dir)
     ]
+    if heap_mb:
+        cmd.insert(1, f"-Xmx{heap_mb}m")
 
-    logs_dir = config.DATA_DIR / "ck_logs"
-    logs_dir.mkdir(exist_ok=True)
-    log_file_path = logs_dir / f"{path_repo.name}-ck.log"
+    log_file_path = log_file_path or config.DATA_DIR / "ck_logs" / f"{path_repo.name}-ck.log"
+    log_file_path.parent.mkdir(parents=True, exist_ok=True)
 
     try:
         with open(log_file_path, 'w') as log_file:
-            result = subprocess.run(
-                cmd, check=True, text=True, timeout=600,
-                stdout=log_file, stderr=subprocess.STDOUT
-            )
-        
-        class_csv_path = config.PATH_OUTPUT_CK / "class.csv"
-        if class_csv_path.exists() and class_csv_path.stat().st_size > 0:
+            process = subprocess.Popen(cmd, text=True, stdout=log_file, stderr=subprocess.STDOUT)
+            erro, motivo = supervise_ck_process(process, log_file_path, output_dir, sem_progresso, prazo_max,
+                                                ao_verificar)
+        if erro:
+            print(f"  ERRO: CK encerrado pelo watchdog em {path_repo.name}: {motivo}.")
+            with open(log_file_path, 'a') as log_file:
+                log_file.write(f"\n\n--- ENCERRADO PELO WATCHDOG: {motivo} ---")
+            raise erro(f"CK encerrado em {path_repo.name}: {motivo}.")
+        class_csv_path = output_dir / "class.csv"
+        if process.returncode == 0 and class_csv_path.exists() and class_csv_path.stat().st_size > 0:
             print(f"  Análise CK concluída com sucesso para {path_repo.name}.")
             return True
-        else:
-            print(f"  AVISO: Análise CK executada, mas 'class.csv' não foi gerado ou está vazio. Verifique o log em: {log_file_path}")
-            return False
+        if ck_out_of_memory(log_file_path):
+            # Classe própria para que só esses repositórios sejam reprocessados, com um heap maior
+            raise CKSemMemoria(f"CK sem memória em {path_repo.name} (heap: {f'{heap_mb} MB' if heap_mb else 'padrão da JVM'}). "
+                               f"Verifique o log em: {log_file_path}")
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+        print(f"  AVISO: Análise CK executada, mas 'class.csv' não foi gerado ou está vazio. Verifique o log em: {log_file_path}")
+        return False
             
     except subprocess.CalledProcessError as e:
         print(f"  ERRO ao executar o CK em {path_repo.name}. O processo retornou um erro. Verifique o log em: {log_file_path}")
         return False
-    except subprocess.TimeoutExpired:
-        print(f"  ERRO: Timeout ao executar o CK em {path_repo.name}. O projeto pode ser muito grande.")
-        with open(log_file_path, 'a') as log_file:
-            log_file.write("\n\n--- TIMEOUT ---")
-        return False
 
 
-def process_ck_results(nome_repo: str) -> dict:
-    """Processa o arquivo 'class.csv' gerado pelo CK e retorna as métricas agregadas."""
-    class_csv_path = config.PATH_OUTPUT_CK / "class.csv"
+def count_comment_lines(java_files: list) -> int:
+    """Linhas que contêm comentários (// ou /* */) nos arquivos informados, ignorando literais de string."""
+    total = 0
+    for arquivo in java_files:
+        try:
+            texto = arquivo.read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            continue
+        linhas = set()
+        linha, posicao = 0, 0
+        for token in _TOKENS_JAVA.finditer(texto):
+            linha += texto.count("\n", posicao, token.start())
+            posicao = token.start()
+            if token.group().startswith("/"):
+                linhas.update(range(linha, linha + token.group().count("\n") + 1))
+        total += len(linhas)
+    return total
+
+
+def index_java_sources(path_repo: Path, caminhos: list) -> dict:
+    """
+    Para cada arquivo: pacote declarado, nomes importados, tipos declarados, supertipos
+    citados em 'extends'/'implements' e todos os identificadores usados.
+    """
+    indice = {}
+    for caminho in caminhos:
+        try:
+            texto = (path_repo / caminho).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            texto = ""
+        codigo = _TOKENS_JAVA.sub(" ", texto)
+        pacote = _PACOTE_JAVA.search(codigo)
+        indice[caminho] = {
+            "pacote": pacote.group(1) if pacote else "",
+            "importados": set(_IMPORT_JAVA.findall(codigo)),
+            "declarados": set(_DECLARACAO_JAVA.findall(codigo)) | {Path(caminho).stem},
+            "supertipos": {nome for trecho in _HERANCA_JAVA.findall(codigo) for nome in _IDENTIFICADOR_JAVA.findall(trecho)},
+            "identificadores": set(_IDENTIFICADOR_JAVA.findall(codigo)),
+        }
+    return indice
+
+
+def process_ck_results(nome_repo: str, output_dir: Path = None, comentarios_total: int = 0) -> dict:
+    """
+    Processa o arquivo 'class.csv' gerado pelo CK e retorna as métricas agregadas,
+    com as mesmas colunas que o script 3 lê de 'metricas.csv'.
+    """
+    class_csv_path = (output_dir or config.PATH_OUTPUT_CK) / "class.csv"
     try:
         df = pd.read_csv(class_csv_path)
         if df.empty:
             return {}
         
         # Remove colunas não utilizadas
-        df = df[["cbo", "dit", "lcom", "loc"]]
+        df = df[["file", "cbo", "dit", "lcom", "loc"]]
 
+        arquivos_java = df["file"].nunique()
         metrics = {
-            "nome_repo": nome_repo,
-            "ck_cbo": df["cbo"].sum(),
-            "ck_dit": df["dit"].mean(),
-            "ck_lcom": df["lcom"].mean(),
-            "ck_loc": df["loc"].sum(),
-            "java_files_count": len(df)
+            "repositorio": nome_repo,
+            "loc_total": df["loc"].sum(),
+            "comentarios_total": comentarios_total,
+            "cbo_total": df["cbo"].sum(),
+            "dit_total": df["dit"].sum(),
+            "lcom_total": df["lcom"].sum(),
+            "arquivos_java": arquivos_java,
+            "loc_media_por_arquivo": round(df["loc"].sum() / arquivos_java, 2),
+            "comentarios_media_por_arquivo": round(comentarios_total / arquivos_java, 2),
         }
         return metrics
     except FileNotFoundError:
@@ -119,51 +302,729 @@ def process_ck_results(nome_repo: str) -> dict:
         return {}
 
 
+def compute_git_process_metrics(path_repo: Path) -> dict:
+    """
+    Calcula métricas de processo a partir do histórico local, em uma única passada do git log:
+    commits, contribuidores, frequência de commits e churn (arquivos alterados).
+    """
+    cmd = ["git", "-C", str(path_repo), "log", "--no-renames", "--name-only",
+           "--format=%x1e%ae%x1f%at"]
+    try:
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True,
+                                encoding="utf-8", errors="replace", timeout=600)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        print(f"  AVISO: Não foi possível ler o histórico de {path_repo.name}. Erro: {e}")
+        return {}
+
+    autores = set()
+    timestamps = []
+    arquivos_distintos = set()
+    arquivos_alterados = 0
+    # Cada commit começa com o separador \x1e; a 1ª linha tem autor e data, o resto são arquivos
+    for bloco in result.stdout.split("\x1e")[1:]:
+        linhas = bloco.splitlines()
+        autor, timestamp = linhas[0].split("\x1f")
+        autores.add(autor.lower())
+        timestamps.append(int(timestamp))
+        arquivos = [linha for linha in linhas[1:] if linha]
+        arquivos_alterados += len(arquivos)
+        arquivos_distintos.update(arquivos)
+
+    if not timestamps:
+        return {}
+
+    meses_ativos = max((max(timestamps) - min(timestamps)) / (30.44 * 86400), 1)
+    return {
+        "git_commits": len(timestamps),
+        "git_contribuidores": len(autores),
+        "git_commits_por_mes": round(len(timestamps) / meses_ativos, 2),
+        "git_arquivos_alterados": arquivos_alterados,
+        "git_arquivos_distintos": len(arquivos_distintos),
+        "git_churn_por_commit": round(arquivos_alterados / len(timestamps), 2),
+    }
+
+
+def estimate_clone_mb(tarefa: dict) -> float:
+    """Espaço em disco estimado do clone (pack + checkout), a partir do diskUsage do GitHub."""
+    if tarefa.get("tamanho_kb"):
+        return tarefa["tamanho_kb"] / 1024 * CLONE_FATOR_DISCO
+    return CLONE_PADRAO_MB
+
+
+def estimate_ck_heap_mb(java_files: list, heap_max_mb: int) -> int:
+    """Heap da JVM estimado a partir do volume de código-fonte Java."""
+    fonte_mb = sum(f.stat().st_size for f in java_files) / 2**20
+    return int(min(max(CK_HEAP_BASE_MB + CK_HEAP_POR_MB_FONTE * fonte_mb, CK_HEAP_BASE_MB), heap_max_mb))
+
+
+def stage_java_files(path_repo: Path, caminhos: list, staging_dir: Path) -> Path:
+    """Monta um diretório só com os arquivos informados, mantendo os caminhos relativos."""
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    for caminho in caminhos:
+        destino = staging_dir / caminho
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(path_repo / caminho, destino)
+        except OSError:
+            shutil.copy2(path_repo / caminho, destino)
+    return staging_dir
+
+
+def merge_ck_rows(path_repo: Path, ck_root: Path, output_dir: Path, manifest: list,
+                  reaproveitados: dict, conn_cache) -> dict:
+    """
+    Junta as linhas recém-geradas pelo CK com as reaproveitadas do cache (indexadas pelo
+    caminho neste repositório) e grava o 'class.csv' e o 'method.csv' combinados em
+    `output_dir`. As linhas novas são salvas no cache por SHA do blob. Retorna as linhas
+    de cada caminho do manifest, com o SHA, para a próxima atualização incremental.
+    """
+    sha_por_caminho = dict(manifest)
+    # Arquivos sem classes (ex.: package-info.java) também contam como analisados
+    novos = {caminho: {"classes": [], "metodos": []} for caminho, _ in manifest if caminho not in reaproveitados}
+    frames = {}
+
+    for nome_csv, chave in (("class.csv", "classes"), ("method.csv", "metodos")):
+        csv_path = output_dir / nome_csv
+        df_novo = pd.DataFrame()
+        if csv_path.exists() and csv_path.stat().st_size > 0:
+            df_novo = pd.read_csv(csv_path)
+
+        if not df_novo.empty:
+            relativos = df_novo["file"].map(lambda f: Path(os.path.relpath(f, ck_root)).as_posix())
+            df_novo["file"] = [str(path_repo / r) for r in relativos]
+            for caminho, grupo in df_novo.groupby(relativos, sort=False):
+                if caminho in novos:
+                    novos[caminho][chave] = grupo.drop(columns="file").to_dict("records")
+
+        linhas_reaproveitadas = [
+            {"file": str(path_repo / caminho), **linha}
+            for caminho, linhas in reaproveitados.items()
+            for linha in linhas[chave]
+        ]
+        frames[nome_csv] = pd.concat([df_novo, pd.DataFrame(linhas_reaproveitadas)], ignore_index=True)
+
+    # Blobs repetidos no mesmo repositório: o cache guarda as linhas de um dos caminhos
+    novos_por_sha = {}
+    for caminho, linhas in novos.items():
+        novos_por_sha.setdefault(sha_por_caminho[caminho], linhas)
+    cache_ck.salva_blobs(conn_cache, novos_por_sha)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for nome_csv, df in frames.items():
+        df.to_csv(output_dir / nome_csv, index=False)
+
+    linhas_por_caminho = {**novos, **reaproveitados}
+    return {
+        caminho: {"sha": sha, "classes": linhas_por_caminho[caminho]["classes"],
+                  "metodos": linhas_por_caminho[caminho]["metodos"]}
+        for caminho, sha in manifest
+    }
+
+
+def remote_head_sha(repo_url: str):
+    """SHA do HEAD remoto, sem clonar. Retorna None se não for possível consultar."""
+    try:
+        result = subprocess.run(["git", "ls-remote", repo_url, "HEAD"], check=True,
+                                capture_output=True, text=True, timeout=60)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return None
+    partes = result.stdout.split()
+    return partes[0] if partes else None
+
+
+def affected_files(path_repo: Path, manifest: list, alterados: list, removidos: list) -> set:
+    """
+    Arquivos que precisam passar pelo CK quando o resto vem do cache, para que DIT e CBO saiam
+    iguais aos de uma análise completa:
+    - os alterados, os que citam algum tipo alterado ou removido e as subclasses destes, em qualquer nível;
+    - o contexto para o CK resolver os tipos de cada um: os pacotes próprio e importados e,
+      recursivamente, os arquivos que declaram seus supertipos.
+    A resolução é textual (declarações, imports e nomes), então erra por excesso, nunca por falta.
+    """
+    indice = index_java_sources(path_repo, [caminho for caminho, _ in manifest])
+    por_pacote, por_tipo, por_supertipo = defaultdict(set), defaultdict(set), defaultdict(set)
+    for caminho, info in indice.items():
+        por_pacote[info["pacote"]].add(caminho)
+        for tipo in info["declarados"]:
+            por_tipo[tipo].add(caminho)
+        for tipo in info["supertipos"]:
+            por_supertipo[tipo].add(caminho)
+
+    def visiveis(caminho: str) -> set:
+        # Pacote próprio e pacotes deste repositório citados nos imports (de tipo, curinga ou estáticos)
+        pacotes = {indice[caminho]["pacote"]}
+        for nome in indice[caminho]["importados"]:
+            while nome and nome not in por_pacote:
+                nome = nome.rpartition(".")[0]
+            if nome:
+                pacotes.add(nome)
+        return pacotes
+
+    # Dos arquivos removidos só resta o nome; dos alterados, os tipos que declaram hoje
+    nomes = {Path(caminho).stem for caminho in removidos}
+    for caminho in alterados:
+        nomes |= indice[caminho]["declarados"]
+    afetados = set(alterados) | {caminho for caminho, info in indice.items() if info["identificadores"] & nomes}
+    pendentes = list(afetados)
+    while pendentes:
+        for tipo in indice[pendentes.pop()]["declarados"]:
+            novos = por_supertipo[tipo] - afetados
+            afetados |= novos
+            pendentes.extend(novos)
+
+    selecionados = set(afetados)
+    for caminho in afetados:
+        for pacote in visiveis(caminho):
+            selecionados |= por_pacote[pacote]
+    pendentes = list(selecionados)
+    while pendentes:
+        caminho = pendentes.pop()
+        pacotes = visiveis(caminho)
+        for tipo in indice[caminho]["supertipos"]:
+            novos = {outro for outro in por_tipo[tipo] - selecionados if indice[outro]["pacote"] in pacotes}
+            selecionados |= novos
+            pendentes.extend(novos)
+    return selecionados
+
+
+@contextmanager
+def reserve_resources(conn_admissao, worker: str, tipo: str, disco_mb: float, ram_mb: float, args,
+                     ao_esperar=None):
+    """Reserva disco/RAM no controle de admissão durante o bloco. Sem controle de admissão, não faz nada."""
+    if conn_admissao is None:
+        yield
+        return
+    admissao.aguarda_admissao(conn_admissao, config.PATH_REPOSITORIES, worker, tipo,
+                              disco_mb, ram_mb, args.margem_disco_mb, args.margem_ram_mb,
+                              ao_esperar=ao_esperar)
+    try:
+        yield
+    finally:
+        admissao.libera(conn_admissao, worker, tipo)
+
+
+def release_clone_ram(conn_admissao, worker: str):
+    """Devolve a RAM da reserva do clone, mantendo a de disco. Sem controle de admissão, não faz nada."""
+    if conn_admissao is not None:
+        admissao.libera_ram(conn_admissao, worker, "clone")
+
+
+def analyze_checkout(path_repo: Path, nome_repo: str, staging_dir: Path, output_dir: Path, args,
+                     worker: str, tipo_ck: str = "ck", conn_cache=None, conn_admissao=None,
+                     renova=None, manifest: list = None, full_name: str = None, anteriores: dict = None,
+                     removidos: list = (), reaproveitar_blobs: bool = False) -> dict:
+    """
+    Roda o CK em um checkout (clone ou worktree) e retorna as métricas agregadas,
+    reaproveitando árvores idênticas já analisadas, as linhas da análise anterior do
+    próprio repositório (`anteriores`, por caminho, com os `removidos` desde então) e,
+    com `reaproveitar_blobs`, os arquivos individuais já no cache. Com `full_name`, as
+    linhas de cada arquivo ficam guardadas para a próxima atualização. `renova` mantém
+    o lease da tarefa vivo enquanto espera a admissão e enquanto o CK roda. Levanta
+    exceção em caso de falha.
+    """
+    if manifest is None and conn_cache is not None:
+        with perfil.etapa("varredura"):
+            manifest = cache_ck.java_manifest(path_repo)
+    arvore = cache_ck.hash_arvore(manifest) if manifest else None
+    cache_arvore = cache_ck.busca_arvore(conn_cache, arvore) if arvore else None
+
+    if cache_arvore:
+        # Árvore Java idêntica a um repositório já analisado: nada para o CK fazer
+        print(f"  Árvore Java idêntica à de {cache_arvore.pop('_repo_origem')}. Reaproveitando métricas.")
+        if full_name:
+            # Sem linhas por arquivo desta análise: a próxima atualização volta a ser completa
+            cache_ck.salva_arquivos_repo(conn_cache, full_name, {})
+        return dict(cache_arvore, repositorio=nome_repo)
+
+    reaproveitados = {}
+    if manifest and (anteriores or reaproveitar_blobs):
+        blobs = cache_ck.busca_blobs(conn_cache, {sha for _, sha in manifest}) if reaproveitar_blobs else {}
+        # Indexado pelo caminho: um blob repetido pode vir do cache em um caminho e ser reanalisado em outro.
+        # As linhas do próprio repositório têm precedência sobre as calculadas em outros repositórios
+        for caminho, sha in manifest:
+            anterior = (anteriores or {}).get(caminho)
+            if anterior and anterior["sha"] == sha:
+                reaproveitados[caminho] = anterior
+            elif sha in blobs:
+                reaproveitados[caminho] = blobs[sha]
+        if reaproveitados:
+            # Quem depende dos arquivos novos, e o contexto de tipos de todos eles, volta ao CK
+            novos = [caminho for caminho, _ in manifest if caminho not in reaproveitados]
+            with perfil.etapa("dependencias"):
+                reanalisar = affected_files(path_repo, manifest, novos, list(removidos))
+            reaproveitados = {
+                caminho: linhas for caminho, linhas in reaproveitados.items() if caminho not in reanalisar
+            }
+    ck_root = path_repo
+    if reaproveitados:
+        novos = [caminho for caminho, _ in manifest if caminho not in reaproveitados]
+        print(f"  {len(manifest) - len(novos)} de {len(manifest)} arquivos .java já estão no cache de resultados.")
+        ck_root = staging_dir
+        with perfil.etapa("staging"):
+            stage_java_files(path_repo, novos, ck_root)
+        java_files = [ck_root / caminho for caminho in novos]
+    else:
+        with perfil.etapa("varredura"):
+            java_files = list(path_repo.rglob("*.java"))
+
+    if java_files:
+        # O -Xmx só é fixado quando há reserva de memória para ele; sem admissão, vale o padrão da JVM
+        heap_mb = estimate_ck_heap_mb(java_files, args.heap_max_mb) if conn_admissao is not None else None
+        try:
+            with reserve_resources(conn_admissao, worker, tipo_ck, 0, heap_mb, args, renova), perfil.etapa("ck"):
+                ck_ok = run_ck_analysis(ck_root, output_dir, heap_mb=heap_mb, java_files=java_files,
+                                        sem_progresso=args.ck_sem_progresso, prazo_max=args.ck_prazo_max,
+                                        ao_verificar=renova,
+                                        # Log por worker: homônimos em workers paralelos não dividem o arquivo
+                                        log_file_path=config.DATA_DIR / "ck_logs" / worker / f"{path_repo.name}-ck.log")
+        finally:
+            if ck_root != path_repo:
+                shutil.rmtree(ck_root, ignore_errors=True)
+    else:
+        # Todos os arquivos já estão no cache
+        shutil.rmtree(output_dir, ignore_errors=True)
+        ck_ok = bool(reaproveitados)
+    if not ck_ok:
+        raise ErroCK(f"Análise CK falhou ou não gerou resultados para {nome_repo}.")
+
+    if manifest:
+        with perfil.etapa("merge_cache"):
+            linhas_por_caminho = merge_ck_rows(path_repo, ck_root, output_dir, manifest, reaproveitados, conn_cache)
+        if full_name:
+            cache_ck.salva_arquivos_repo(conn_cache, full_name, linhas_por_caminho)
+    # Comentários contados no checkout inteiro: o CK não mede, e parte dos arquivos pode ter vindo do cache
+    with perfil.etapa("comentarios"):
+        comentarios = count_comment_lines(
+            [path_repo / caminho for caminho, _ in manifest] if manifest else list(path_repo.rglob("*.java"))
+        )
+    with perfil.etapa("process_ck_results"):
+        ck_metrics = process_ck_results(nome_repo, output_dir, comentarios)
+    if not ck_metrics:
+        raise SemMetricas(f"Nenhuma métrica extraída para {nome_repo}.")
+    if arvore:
+        cache_ck.salva_arvore(conn_cache, arvore, nome_repo, ck_metrics)
+    return ck_metrics
+
+
+def analyze_repo(tarefa: dict, worker: str, conn, args, conn_admissao=None, conn_cache=None) -> dict:
+    """Clona, roda o CK e agrega as métricas de uma tarefa da fila. Levanta exceção em caso de falha."""
+    nome_repo, full_name = tarefa["repo_name"], tarefa["full_name"]
+    # Diretórios por worker, para que processos na mesma máquina não se atropelem
+    dest_folder = config.PATH_REPOSITORIES / worker
+    output_dir = config.PATH_OUTPUT_CK / worker
+    dest_folder.mkdir(parents=True, exist_ok=True)
+
+    def renova():
+        return fila_trabalho.renova_lease(conn, full_name, worker, args.lease)
+
+    estado = cache_ck.busca_estado(conn_cache, full_name) if conn_cache is not None else None
+    if estado:
+        anterior = fila_trabalho.busca_resultado(conn, full_name)
+        if anterior and remote_head_sha(tarefa["url"]) == estado["commit_sha"]:
+            print(f"  Sem commits novos desde {estado['commit_sha'][:12]}. Reaproveitando métricas.")
+            return anterior
+
+    path_repo = None
+    with reserve_resources(conn_admissao, worker, "clone", estimate_clone_mb(tarefa), CLONE_RAM_MB, args, renova):
+        try:
+            with perfil.etapa("clone"):
+                path_repo = clone_repo(tarefa["url"], dest_folder, historico=args.historico_git)
+            # O git terminou: o checkout continua ocupando disco, mas a memória do clone não pode
+            # ficar reservada enquanto este worker espera a JVM (outro worker poderia esperar por ela)
+            release_clone_ram(conn_admissao, worker)
+            # O clone pode ter consumido boa parte do lease; renova antes do CK
+            if not renova():
+                print(f"  AVISO: Lease de {nome_repo} expirou durante o clone.")
+
+            manifest = None
+            if conn_cache is not None:
+                with perfil.etapa("varredura"):
+                    manifest = cache_ck.java_manifest(path_repo)
+            anteriores, removidos = None, []
+            if estado and manifest:
+                alterados, removidos = cache_ck.diff_manifests(estado["manifest"], manifest)
+                print(f"  Desde {estado['commit_sha'][:12]}: {len(alterados)} arquivos .java alterados ou novos, "
+                      f"{len(removidos)} removidos.")
+                if len(alterados) + len(removidos) > args.incremental_limite * len(manifest):
+                    print("  Mudanças demais para uma atualização incremental. Reanalisando a árvore inteira.")
+                else:
+                    # Só as linhas deste repositório: as do cache de blobs podem vir do contexto de um fork
+                    anteriores = cache_ck.busca_arquivos_repo(conn_cache, full_name)
+                    if not anteriores:
+                        print("  Linhas por arquivo da análise anterior indisponíveis. Reanalisando a árvore inteira.")
+
+            ck_metrics = analyze_checkout(path_repo, nome_repo, dest_folder / ".novos" / nome_repo, output_dir,
+                                          args, worker, conn_cache=conn_cache, conn_admissao=conn_admissao,
+                                          renova=renova, manifest=manifest, full_name=full_name,
+                                          anteriores=anteriores, removidos=removidos,
+                                          reaproveitar_blobs=args.reaproveitar_blobs)
+            if manifest:
+                cache_ck.salva_estado(conn_cache, full_name, run_git(path_repo, "rev-parse", "HEAD").strip(), manifest)
+            if args.historico_git:
+                with perfil.etapa("historico_git"):
+                    ck_metrics.update(compute_git_process_metrics(path_repo))
+            return ck_metrics
+        finally:
+            if path_repo:
+                with perfil.etapa("remocao"):
+                    remove_clone_repo(path_repo)
+
+
+def run_git(path_repo: Path, *git_args: str, timeout: int = 300) -> str:
+    """Executa um comando git no repositório e retorna a saída. Levanta ErroGit em caso de falha."""
+    try:
+        result = subprocess.run(["git", "-C", str(path_repo), *git_args], check=True, capture_output=True,
+                                text=True, encoding="utf-8", errors="replace", timeout=timeout)
+        return result.stdout
+    except subprocess.CalledProcessError as e:
+        raise ErroGit(f"Falha em 'git {' '.join(git_args)}': {e.stderr}")
+    except subprocess.TimeoutExpired:
+        raise ErroGit(f"Timeout em 'git {' '.join(git_args)}'.")
+
+
+def clone_bare(repo_url: str, dest_folder: Path) -> Path:
+    """Clone bare e sem blobs: um único armazenamento de objetos compartilhado por todos os worktrees."""
+    nome_repo = repo_url.rstrip("/").split("/")[-1]
+    path_bare = dest_folder / f"{nome_repo}.git"
+    shutil.rmtree(path_bare, ignore_errors=True)
+
+    print(f"  Clonando {nome_repo} (bare, blobless)...")
+    try:
+        subprocess.run(
+            ["git", "clone", "--bare", "--filter=blob:none", repo_url, str(path_bare)],
+            check=True, capture_output=True, text=True, timeout=300
+        )
+        return path_bare
+    except subprocess.CalledProcessError as e:
+        raise ErroClone(f"Falha ao clonar {nome_repo}: {e.stderr}")
+    except subprocess.TimeoutExpired:
+        raise ErroClone(f"Timeout ao clonar {nome_repo}.")
+
+
+def _evenly_spaced(itens: list, quantidade: int) -> list:
+    """Escolhe `quantidade` itens igualmente espaçados, sempre incluindo o último."""
+    if len(itens) <= quantidade:
+        return itens
+    if quantidade == 1:
+        return itens[-1:]
+    indices = sorted({round(i * (len(itens) - 1) / (quantidade - 1)) for i in range(quantidade)})
+    return [itens[i] for i in indices]
+
+
+def select_revisions(path_bare: Path, quantidade: int, modo: str) -> list:
+    """
+    Seleciona as revisões históricas a analisar, da mais antiga para a mais nova:
+    tags de release (modo 'tags') ou commits igualmente espaçados do first-parent (modo 'commits').
+    O HEAD sempre entra como última revisão.
+    """
+    head = run_git(path_bare, "log", "-1", "--format=%H%x09%ct", "HEAD").split()
+    revisoes = []
+    if modo == "tags":
+        saida = run_git(path_bare, "for-each-ref", "--sort=creatordate",
+                        "--format=%(refname:short)%09%(objectname)%09%(*objectname)%09%(creatordate:unix)",
+                        "refs/tags")
+        for linha in saida.splitlines():
+            tag, sha, sha_commit, data = linha.split("\t")
+            if data:
+                revisoes.append({"revisao": tag, "sha": sha_commit or sha, "timestamp": int(data)})
+        if not revisoes:
+            print("  AVISO: Nenhuma tag encontrada. Usando commits igualmente espaçados.")
+    if not revisoes:
+        saida = run_git(path_bare, "log", "--first-parent", "--reverse", "--format=%H%x09%ct", "HEAD")
+        revisoes = [
+            {"revisao": sha[:12], "sha": sha, "timestamp": int(data)}
+            for sha, data in (linha.split("\t") for linha in saida.splitlines())
+        ]
+
+    revisoes = [r for r in revisoes if r["sha"] != head[0]]
+    selecionadas = _evenly_spaced(revisoes, quantidade - 1) if quantidade > 1 else []
+    selecionadas.append({"revisao": "HEAD", "sha": head[0], "timestamp": int(head[1])})
+    return selecionadas
+
+
+def estimate_snapshots_mb(tarefa: dict, quantidade: int) -> float:
+    """Disco estimado do modo histórico: o armazenamento de objetos mais um checkout por revisão."""
+    checkout_mb = (tarefa["tamanho_kb"] / 1024) if tarefa.get("tamanho_kb") else CLONE_PADRAO_MB / CLONE_FATOR_DISCO
+    return estimate_clone_mb(tarefa) + quantidade * checkout_mb
+
+
+def analyze_snapshot(path_worktree: Path, nome_repo: str, revisao: dict, dest_folder: Path,
+                     output_dir: Path, args, worker: str, tipo_ck: str) -> dict:
+    """Roda o CK em um worktree. Executa em thread própria, com conexões SQLite próprias."""
+    conn_cache = None if args.sem_cache else cache_ck.conecta(args.cache)
+    conn_admissao = None if args.sem_admissao else admissao.conecta(config.PATH_REPOSITORIES / ".admissao.sqlite")
+    try:
+        print(f"  [{revisao['revisao']}] Analisando {nome_repo} em {revisao['sha'][:12]}...")
+        ck_metrics = analyze_checkout(path_worktree, nome_repo, dest_folder / ".novos" / path_worktree.name,
+                                      output_dir, args, worker, tipo_ck, conn_cache, conn_admissao,
+                                      reaproveitar_blobs=args.reaproveitar_blobs)
+    finally:
+        for c in (conn_cache, conn_admissao):
+            if c is not None:
+                c.close()
+    ck_metrics.update({
+        "revisao": revisao["revisao"],
+        "sha": revisao["sha"],
+        "data_revisao": pd.to_datetime(revisao["timestamp"], unit="s").strftime("%Y-%m-%d"),
+    })
+    return ck_metrics
+
+
+def analyze_repo_snapshots(tarefa: dict, worker: str, conn, args, conn_admissao=None) -> list:
+    """
+    Modo histórico: um clone bare por repositório, um worktree por revisão selecionada
+    e o CK rodando em paralelo nos worktrees. Retorna as métricas de cada revisão.
+    """
+    nome_repo, full_name = tarefa["repo_name"], tarefa["full_name"]
+    dest_folder = config.PATH_REPOSITORIES / worker
+    dest_folder.mkdir(parents=True, exist_ok=True)
+
+    def renova():
+        return fila_trabalho.renova_lease(conn, full_name, worker, args.lease)
+
+    disco_mb = estimate_snapshots_mb(tarefa, args.snapshots)
+    path_bare = None
+    worktrees = []
+    with reserve_resources(conn_admissao, worker, "clone", disco_mb, CLONE_RAM_MB, args, renova):
+        try:
+            with perfil.etapa("clone"):
+                path_bare = clone_bare(tarefa["url"], dest_folder)
+            revisoes = select_revisions(path_bare, args.snapshots, args.snapshots_modo)
+            print(f"  {len(revisoes)} revisões selecionadas: {', '.join(r['revisao'] for r in revisoes)}")
+
+            # Worktrees criados em sequência: cada checkout busca só os blobs que ainda faltam
+            for revisao in revisoes:
+                rotulo = re.sub(r"[^\w.-]", "_", revisao["revisao"])
+                path_worktree = dest_folder / ".snapshots" / f"{nome_repo}@{rotulo}"
+                shutil.rmtree(path_worktree, ignore_errors=True)
+                with perfil.etapa("worktrees"):
+                    run_git(path_bare, "worktree", "add", "--detach", "--force", str(path_worktree), revisao["sha"],
+                            timeout=600)
+                worktrees.append((revisao, path_worktree))
+                renova()
+            release_clone_ram(conn_admissao, worker)
+
+            with ThreadPoolExecutor(max_workers=args.snapshots_paralelos) as executor:
+                futuros = {
+                    executor.submit(analyze_snapshot, path_worktree, nome_repo, revisao, dest_folder,
+                                    config.PATH_OUTPUT_CK / worker / path_worktree.name, args, worker, f"ck:{i}"): revisao
+                    for i, (revisao, path_worktree) in enumerate(worktrees)
+                }
+                pendentes = set(futuros)
+                while pendentes:
+                    # A thread principal mantém o lease vivo enquanto os CKs rodam
+                    _, pendentes = wait(pendentes, timeout=60)
+                    renova()
+
+            snapshots, erro_head = [], None
+            for futuro, revisao in futuros.items():
+                try:
+                    snapshots.append(futuro.result())
+                except Exception as e:
+                    print(f"  AVISO: Revisão {revisao['revisao']} de {nome_repo} falhou: {e}")
+                    if revisao["revisao"] == "HEAD":
+                        erro_head = e
+            # A linha do repositório em 'metricas.csv' é o HEAD: sem ele a tarefa falha, em vez
+            # de promover uma revisão antiga
+            if erro_head:
+                raise erro_head
+            if args.historico_git:
+                # O clone bare já tem todo o histórico de commits e árvores
+                with perfil.etapa("historico_git"):
+                    snapshots[-1].update(compute_git_process_metrics(path_bare))
+            return snapshots
+        finally:
+            with perfil.etapa("remocao"):
+                for _, path_worktree in worktrees:
+                    remove_clone_repo(path_worktree)
+                if path_bare:
+                    remove_clone_repo(path_bare)
+
+
+def worker_loop(worker: str, args):
+    """Consome a fila até que não haja mais tarefas pendentes."""
+    conn = fila_trabalho.conecta(args.fila)
+    conn_admissao = None
+    if not args.sem_admissao:
+        conn_admissao = admissao.conecta(config.PATH_REPOSITORIES / ".admissao.sqlite")
+    conn_cache = None
+    if not args.sem_cache:
+        conn_cache = cache_ck.conecta(args.cache)
+    if args.profile:
+        perfil.configura(args.profile_dir, args.profile_repos, args.profile_top, args.profile_modo)
+    processados = 0
+    while True:
+        tarefa = fila_trabalho.reserva_proxima(conn, worker, args.lease)
+        if tarefa is None:
+            break
+
+        full_name = tarefa["full_name"]
+        print(f"\n[ {worker} | tentativa {tarefa['tentativas'] + 1} ]: {full_name} ")
+        snapshots = None
+        perfil.inicia_repo(full_name)
+        try:
+            if args.snapshots:
+                snapshots = analyze_repo_snapshots(tarefa, worker, conn, args, conn_admissao)
+                # A linha do repositório em 'metricas.csv' é o HEAD, sempre a última revisão
+                ck_metrics = {k: v for k, v in snapshots[-1].items() if k not in ("revisao", "sha", "data_revisao")}
+            else:
+                ck_metrics = analyze_repo(tarefa, worker, conn, args, conn_admissao, conn_cache)
+        except Exception as e:
+            print(f"  ERRO ao processar o repositório {full_name}: {e}")
+            if not fila_trabalho.registra_falha(conn, full_name, worker, type(e).__name__, str(e)):
+                print(f"  AVISO: Lease de {full_name} expirou antes do registro da falha.")
+            continue
+        finally:
+            perfil.finaliza_repo()
+
+        if fila_trabalho.conclui(conn, full_name, worker, ck_metrics, snapshots):
+            processados += 1
+            print(f"  Métricas de {full_name} processadas com sucesso.")
+        else:
+            print(f"  AVISO: Lease de {full_name} expirou; o resultado foi descartado.")
+
+    conn.close()
+    if conn_admissao is not None:
+        conn_admissao.close()
+    if conn_cache is not None:
+        conn_cache.close()
+    print(f"\n[ {worker} ] Fila vazia. {processados} repositórios concluídos por este worker.")
+
+
+def export_metrics(conn) -> None:
+    """Grava 'metricas.csv' (e 'metricas_snapshots.csv', se houver) com os resultados concluídos da fila."""
+    metricas = fila_trabalho.exporta_resultados(conn)
+    if not metricas:
+        print("\nNenhuma métrica do CK foi gerada.")
+        return
+    df_metricas_ck = pd.DataFrame(metricas)
+    output_path = config.DATA_DIR / "metricas.csv"
+    df_metricas_ck.to_csv(output_path, index=False)
+    print(f"\n{len(df_metricas_ck)} repositórios analisados com sucesso.")
+    print(f"Métricas do CK salvas em: {output_path}")
+
+    snapshots = fila_trabalho.exporta_snapshots(conn)
+    if snapshots:
+        output_path = config.DATA_DIR / "metricas_snapshots.csv"
+        pd.DataFrame(snapshots).to_csv(output_path, index=False)
+        print(f"Métricas de {len(snapshots)} revisões históricas salvas em: {output_path}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analisa os repositórios de 'repos.csv' com o CK.")
+    parser.add_argument("--fila", type=Path, default=config.DATA_DIR / "fila.sqlite",
+                        help="Banco SQLite da fila. Use um caminho compartilhado para rodar em várias máquinas.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Quantidade de processos worker nesta máquina.")
+    parser.add_argument("--lease", type=float, default=fila_trabalho.LEASE_PADRAO,
+                        help="Duração do lease de cada tarefa, em segundos.")
+    parser.add_argument("--reprocessar-falhas", nargs="*", metavar="CLASSE_ERRO",
+                        help="Devolve falhas para a fila (todas ou só as classes de erro informadas).")
+    parser.add_argument("--historico-git", action="store_true",
+                        help="Clona o histórico (sem blobs) e calcula métricas de processo com o git log.")
+    parser.add_argument("--sem-admissao", action="store_true",
+                        help="Desliga o controle de admissão por disco/memória.")
+    parser.add_argument("--margem-disco-mb", type=float, default=2048,
+                        help="Espaço em disco que deve continuar livre após admitir um clone.")
+    parser.add_argument("--margem-ram-mb", type=float, default=1024,
+                        help="Memória que deve continuar disponível após admitir uma JVM.")
+    parser.add_argument("--heap-max-mb", type=int, default=4096,
+                        help="Heap máximo (-Xmx) de uma JVM do CK. Com --sem-admissao, a JVM usa o heap padrão.")
+    parser.add_argument("--ck-sem-progresso", type=float, default=CK_SEM_PROGRESSO,
+                        help="Segundos sem crescimento do log/saída do CK antes de encerrar a JVM.")
+    parser.add_argument("--ck-prazo-max", type=float, default=CK_PRAZO_MAXIMO,
+                        help="Tempo máximo de uma execução do CK, mesmo que ela esteja avançando.")
+    parser.add_argument("--snapshots", type=int, default=0,
+                        help="Analisa N revisões históricas por repositório (0 = só o HEAD, via shallow clone).")
+    parser.add_argument("--snapshots-modo", choices=["tags", "commits"], default="tags",
+                        help="Revisões históricas a partir das tags ou de commits igualmente espaçados.")
+    parser.add_argument("--snapshots-paralelos", type=int, default=2,
+                        help="Quantas revisões de um mesmo repositório rodam o CK ao mesmo tempo.")
+    parser.add_argument("--cache", type=Path, default=config.DATA_DIR / "cache_ck.sqlite",
+                        help="Banco com os resultados do CK por blob do git, compartilhado entre repositórios.")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="Roda o CK na árvore inteira de todos os repositórios, sem reaproveitar resultados.")
+    parser.add_argument("--reaproveitar-blobs", action="store_true",
+                        help="Além de árvores idênticas, reaproveita arquivos .java já analisados em outros "
+                             "repositórios; quem depende dos arquivos novos e o contexto de tipos deles voltam ao CK.")
+    parser.add_argument("--atualizar", action="store_true",
+                        help="Devolve os repositórios já analisados para a fila e os atualiza de forma incremental.")
+    parser.add_argument("--incremental-limite", type=float, default=0.3,
+                        help="Fração de arquivos alterados acima da qual a atualização reanalisa a árvore inteira.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Mede cada etapa do lado Python (cProfile e/ou amostragem) e grava pstats e pilhas colapsadas.")
+    parser.add_argument("--profile-repos", nargs="*", metavar="DONO/REPO",
+                        help="Restringe o profiling a estes repositórios, pelo full_name (padrão: todos).")
+    parser.add_argument("--profile-dir", type=Path, default=config.DATA_DIR / "perfil",
+                        help="Diretório de saída do profiling.")
+    parser.add_argument("--profile-modo", choices=["cprofile", "amostragem", "ambos"], default="ambos",
+                        help="Profiling determinístico, por amostragem de pilhas, ou os dois.")
+    parser.add_argument("--profile-top", type=int, default=25,
+                        help="Quantidade de funções no resumo de cada etapa.")
+    parser.add_argument("--amostra", type=int, metavar="N",
+                        help="Enfileira só uma amostra estratificada de N repositórios, para a prévia do relatório "
+                             "(com N menor que o número de estratos, só os N maiores estratos entram).")
+    parser.add_argument("--exportar", action="store_true",
+                        help="Regrava 'metricas.csv' com o que já foi concluído na fila e sai.")
+    parser.add_argument("--status", action="store_true",
+                        help="Mostra o resumo da fila e sai.")
+    return parser.parse_args()
+
+
 def main():
     print("\n--- INICIANDO SCRIPT 2: ANÁLISE COM CK ---")
-    
+    args = parse_args()
+
     arq_repos = config.DATA_DIR / "repos.csv"
     if not arq_repos.exists():
         print(f"ERRO: Arquivo com os repositórios '{arq_repos}' não encontrado.")
         return
 
+    conn = fila_trabalho.conecta(args.fila)
+    if args.status:
+        for chave, total in sorted(fila_trabalho.resumo(conn).items()):
+            print(f"  {chave}: {total}")
+        return
+
+    if args.exportar:
+        export_metrics(conn)
+        return
+
     repositorios = pd.read_csv(arq_repos)
-    metricas = []
-    
-    total_repos = len(repositorios)
-    for index, repo in repositorios.iterrows():
-        nome_repo = repo["nome_repo"]
-        repo_url = repo["url"]
-        print(f"\n[ Processando {index + 1}/{total_repos} ]: {repo['full_name']} ")
-        
-        path_repo = None
-        try:
-            path_repo = clone_repo(repo_url, config.PATH_REPOSITORIES)
-            
-            if run_ck_analysis(path_repo):
-                ck_metrics = process_ck_results(nome_repo)
-                if ck_metrics:
-                    metricas.append(ck_metrics)
-                    print(f"  Métricas de {nome_repo} processadas com sucesso.")
-            else:
-                print(f"  Análise CK falhou ou não gerou resultados para {nome_repo}.")
+    if args.amostra:
+        # Prévia: só uma amostra estratificada entra na fila; uma execução sem --amostra completa o restante
+        repositorios = amostragem.amostra_estratificada(repositorios, args.amostra)
+        print(f"Prévia: amostra estratificada de {len(repositorios)} repositórios (estrelas x tamanho).")
+    novos = fila_trabalho.enfileira_repos(conn, repositorios.to_dict("records"))
+    print(f"{novos} novos repositórios adicionados à fila ({len(repositorios)} selecionados de 'repos.csv').")
 
-        except Exception as e:
-            print(f"  ERRO GERAL ao processar o repositório {nome_repo}: {e}")
-        finally:
-            if path_repo:
-                remove_clone_repo(path_repo)
-    
-    if not metricas:
-        print("\nNenhuma métrica do CK foi gerada.")
+    if args.atualizar:
+        total = fila_trabalho.reabre_concluidos(conn)
+        print(f"{total} repositórios já analisados devolvidos para a fila para atualização incremental.")
+
+    if args.reprocessar_falhas is not None:
+        total = fila_trabalho.reprocessa_falhas(conn, args.reprocessar_falhas or None)
+        print(f"{total} repositórios com falha devolvidos para a fila.")
+
+    prefixo = f"{socket.gethostname()}-{os.getpid()}"
+    if args.workers <= 1:
+        worker_loop(f"{prefixo}-0", args)
     else:
-        df_metricas_ck = pd.DataFrame(metricas)
-        output_path = config.DATA_DIR / "metricas.csv"
-        df_metricas_ck.to_csv(output_path, index=False)
-        print(f"\n{len(df_metricas_ck)} repositórios analisados com sucesso.")
-        print(f"Métricas do CK salvas em: {output_path}")
+        processos = [
+            multiprocessing.Process(target=worker_loop, args=(f"{prefixo}-{i}", args))
+            for i in range(args.workers)
+        ]
+        for p in processos:
+            p.start()
+        for p in processos:
+            p.join()
+
+    for chave, total in sorted(fila_trabalho.resumo(conn).items()):
+        print(f"  {chave}: {total}")
+    export_metrics(conn)
+    conn.close()
 
     print("--- SCRIPT 2: ANÁLISE COM CK FINALIZADO ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
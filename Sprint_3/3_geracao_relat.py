@@ -1,10 +1,19 @@
+import argparse
+import sqlite3
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from scipy.stats import spearmanr
 import numpy as np
+from pathlib import Path
+from matplotlib.colors import LogNorm
+import amostragem
+import fila_trabalho
 
-def load_and_merge_data(metrics_path='./data/metricas.csv', repos_path='./data/repos.csv'):
+N_BOOTSTRAP = 500
+
+def load_and_merge_data(metrics_path='./data/metricas.csv', repos_path='./data/repos.csv',
+                        queue_path='./data/fila.sqlite'):
     try:
         df_metrics = pd.read_csv(metrics_path)
         df_repos = pd.read_csv(repos_path)
@@ -13,7 +22,26 @@ def load_and_merge_data(metrics_path='./data/metricas.csv', repos_path='./data/r
         return None
 
     df_metrics.rename(columns={'repositorio': 'repo_name'}, inplace=True)
-    df_full = pd.merge(df_repos, df_metrics, on='repo_name', how='inner')
+    df_repos['estrato'] = amostragem.estratos(df_repos)
+    if 'full_name' in df_metrics.columns:
+        # O nome curto se repete entre donos (ex.: TheAlgorithms/Java e DuGuQiuBai/Java)
+        chave = ['full_name']
+        df_metrics = df_metrics.drop(columns='repo_name')
+    else:
+        # 'metricas.csv' antigo, só com o nome curto. Os dois arquivos seguem a ordem da coleta,
+        # então a k-ésima ocorrência de um nome em um corresponde à k-ésima no outro; nomes
+        # repetidos com contagens diferentes nos dois arquivos são ambíguos e ficam de fora
+        n_repos = df_repos['repo_name'].value_counts()
+        n_metricas = df_metrics['repo_name'].value_counts()
+        ambiguos = n_metricas.index[(n_repos.reindex(n_metricas.index, fill_value=0) > 1)
+                                    & (n_repos.reindex(n_metricas.index, fill_value=0) != n_metricas)]
+        if len(ambiguos):
+            print(f"AVISO: Nomes repetidos sem correspondência única, ignorados: {', '.join(ambiguos)}")
+        df_metrics = df_metrics[~df_metrics['repo_name'].isin(ambiguos)].copy()
+        df_repos['ocorrencia'] = df_repos.groupby('repo_name').cumcount()
+        df_metrics['ocorrencia'] = df_metrics.groupby('repo_name').cumcount()
+        chave = ['repo_name', 'ocorrencia']
+    df_full = pd.merge(df_repos, df_metrics, on=chave, how='inner')
     df_full = df_full[df_full['arquivos_java'] > 0].copy()
 
     df_full['cbo_avg'] = df_full['cbo_total'] / df_full['arquivos_java']
@@ -28,19 +56,97 @@ def load_and_merge_data(metrics_path='./data/metricas.csv', repos_path='./data/r
         'comentarios_total': 'Tamanho (Comentários)'
     }, inplace=True)
 
+    em_aberto = pending_repos(df_repos, queue_path)
+    if em_aberto:
+        # Tamanho de cada estrato na população, para ponderar as estimativas da prévia
+        df_full.attrs['estratos_populacao'] = df_repos['estrato'].value_counts().to_dict()
+
     print("Dados carregados e processados com sucesso.")
     print(f"Número de repositórios na análise: {len(df_full)}")
+    if em_aberto:
+        print(f"PRÉVIA: {len(df_full)} de {len(df_repos)} repositórios na análise, {em_aberto} ainda sem "
+              "análise na fila. Estimativas com margens de erro da amostra estratificada.")
     
     return df_full
 
+def pending_repos(df_repos, queue_path):
+    """
+    Quantos repositórios de 'repos.csv' a fila do script 2 ainda não finalizou. Falhas contam
+    como finalizadas; sem fila (dados de uma coleta antiga), a coleta é considerada completa.
+    A fila é aberta só para leitura: o relatório não cria tabelas nem migra o banco.
+    """
+    if not Path(queue_path).exists():
+        return 0
+    conn = fila_trabalho.conecta_leitura(Path(queue_path))
+    try:
+        return len(fila_trabalho.em_aberto(conn, df_repos['full_name']))
+    except sqlite3.DatabaseError as e:
+        # Fila em formato antigo (ainda não migrada pelo script 2) ou ilegível: na dúvida, é prévia
+        print(f"AVISO: Não foi possível ler a fila '{queue_path}' ({e}). Tratando a coleta como em andamento.")
+        return len(df_repos)
+    finally:
+        conn.close()
+
+def preview_population(df):
+    """Tamanhos dos estratos na população se a coleta ainda está em andamento; senão None."""
+    return df.attrs.get('estratos_populacao')
+
+def _finite_population_factor(df, populacao):
+    # Fator de correção para população finita: a margem de erro vai a zero quando todos forem analisados
+    return np.sqrt(max(1 - len(df) / sum(populacao.values()), 0))
+
+def stratified_mean(df, col, populacao):
+    """Média estratificada e seu erro padrão, ponderando cada estrato pelo seu tamanho na população."""
+    media, variancia, peso_total = 0.0, 0.0, 0.0
+    total = sum(populacao.values())
+    for estrato, grupo in df.groupby('estrato'):
+        valores = grupo[col].dropna()
+        n_h, N_h = len(valores), populacao[estrato]
+        if n_h == 0:
+            continue
+        peso = N_h / total
+        peso_total += peso
+        media += peso * valores.mean()
+        if n_h > 1:
+            variancia += peso ** 2 * (1 - n_h / N_h) * valores.var(ddof=1) / n_h
+    # Estratos ainda sem nenhum repositório analisado ficam de fora; renormaliza os pesos
+    return media / peso_total, np.sqrt(variancia) / peso_total
+
+def stratified_bootstrap(df, statistic, n_boot=N_BOOTSTRAP, seed=42):
+    """Reamostra com reposição dentro de cada estrato e aplica `statistic` a cada réplica."""
+    rng = np.random.default_rng(seed)
+    grupos = [grupo.index.to_numpy() for _, grupo in df.groupby('estrato')]
+    return [
+        statistic(df.loc[np.concatenate([rng.choice(g, size=len(g), replace=True) for g in grupos])])
+        for _ in range(n_boot)
+    ]
+
 def generate_descriptive_stats(df, process_cols, quality_cols):
     if df is None:
         return
     
     stats = df[process_cols + quality_cols].describe().transpose()
     stats_view = stats[['mean', '50%', 'std', 'min', 'max']].rename(columns={'50%': 'median'})
+
+    populacao = preview_population(df)
+    if populacao:
+        cols = process_cols + quality_cols
+        fator = _finite_population_factor(df, populacao)
+        medianas = np.array(stratified_bootstrap(df, lambda d: d[cols].median().to_numpy()))
+        baixo, alto = np.percentile(medianas, [2.5, 97.5], axis=0)
+        for i, col in enumerate(cols):
+            media, erro = stratified_mean(df, col, populacao)
+            mediana = stats_view.loc[col, 'median']
+            stats_view.loc[col, 'mean'] = media
+            stats_view.loc[col, '± IC95 mean'] = 1.96 * erro
+            stats_view.loc[col, 'IC95 median'] = (f"[{mediana - (mediana - baixo[i]) * fator:.2f}, "
+                                                  f"{mediana + (alto[i] - mediana) * fator:.2f}]")
+        stats_view = stats_view[['mean', '± IC95 mean', 'median', 'IC95 median', 'std', 'min', 'max']]
     
-    print("\n--- Tabela 1: Estatísticas Descritivas ---")
+    titulo = "Tabela 1: Estatísticas Descritivas"
+    if populacao:
+        titulo += f" (prévia: {len(df)} de {sum(populacao.values())} repositórios)"
+    print(f"\n--- {titulo} ---")
     print(stats_view.to_markdown())
 
 def generate_correlation_heatmap(df, cols_for_corr):
@@ -60,16 +166,32 @@ def generate_correlation_heatmap(df, cols_for_corr):
     }
     df_corr = df[cols_for_corr].rename(columns=short_names_map)
     corr_matrix = df_corr.corr(method='spearman')
+
+    annot, fmt = True, ".2f"
+    title, filename = 'Matriz de Correlação de Spearman', 'heatmap.png'
+    populacao = preview_population(df)
+    if populacao:
+        # Margem de erro de cada coeficiente por bootstrap estratificado
+        df_corr['estrato'] = df['estrato']
+        replicas = np.array(stratified_bootstrap(
+            df_corr, lambda d: d.drop(columns='estrato').corr(method='spearman').to_numpy()
+        ))
+        baixo, alto = np.nanpercentile(replicas, [2.5, 97.5], axis=0)
+        margem = (alto - baixo) / 2 * _finite_population_factor(df, populacao)
+        annot = np.vectorize(lambda r, m: f"{r:.2f}\n±{m:.2f}")(corr_matrix.to_numpy(), margem)
+        fmt = ""
+        title += f' (prévia: {len(df)} de {sum(populacao.values())} repositórios)'
+        filename = 'heatmap_previa.png'
     
     plt.figure(figsize=(12, 10))
-    sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', fmt=".2f", linewidths=.5, annot_kws={"size": 10})
-    plt.title('Matriz de Correlação de Spearman', fontsize=18, pad=20)
+    sns.heatmap(corr_matrix, annot=annot, cmap='coolwarm', fmt=fmt, linewidths=.5, annot_kws={"size": 10})
+    plt.title(title, fontsize=18, pad=20)
     plt.xticks(rotation=45, ha='right', fontsize=10)
     plt.yticks(rotation=0, fontsize=10)
     plt.tight_layout()
-    plt.savefig('heatmap.png', dpi=300, bbox_inches='tight')
+    plt.savefig(filename, dpi=300, bbox_inches='tight')
     plt.show()
-    print("\nHeatmap de correlação salvo como 'heatmap.png'")
+    print(f"\nHeatmap de correlação salvo como '{filename}'")
 
 def plot_individual_research_question(df, x_var, y_var, rq_num, x_label, y_label, filename, x_scale=None, x_scale_params=None):
     if df is None:
@@ -95,11 +217,153 @@ def plot_individual_research_question(df, x_var, y_var, rq_num, x_label, y_label
     print(f"Gráfico salvo como '{filename}'")
 
 
+def _log_transform(values):
+    """Escala log simétrica: sign(v) * log10(1 + |v|), válida para zeros e negativos."""
+    return np.sign(values) * np.log10(1 + np.abs(values))
+
+def _inverse_log_transform(values):
+    return np.sign(values) * (10 ** np.abs(values) - 1)
+
+def iter_metric_chunks(source, cols, chunksize=500_000):
+    """Itera sobre um DataFrame ou CSV do CK em blocos, lendo somente as colunas pedidas."""
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source[cols].iloc[start:start + chunksize]
+    else:
+        yield from pd.read_csv(source, usecols=cols, chunksize=chunksize)
+
+def compute_density_grid(source, x_var, y_var, bins=200, log_scale=(True, True), chunksize=500_000):
+    """
+    Pré-agrega os pontos em um histograma 2D de tamanho fixo, bloco a bloco.
+    Memória e tempo de renderização dependem de `bins`, não do número de linhas.
+    Retorna (contagens[nx, ny], bordas_x, bordas_y) no espaço transformado.
+    """
+    cols = [x_var, y_var]
+
+    def transform(chunk):
+        values = chunk[cols].apply(pd.to_numeric, errors='coerce').dropna().to_numpy(dtype=float, copy=True)
+        for i, use_log in enumerate(log_scale):
+            if use_log:
+                values[:, i] = _log_transform(values[:, i])
+        return values
+
+    # 1ª passada: apenas os limites, para que as bordas sejam iguais em todos os blocos
+    lo = np.array([np.inf, np.inf])
+    hi = np.array([-np.inf, -np.inf])
+    for chunk in iter_metric_chunks(source, cols, chunksize):
+        values = transform(chunk)
+        if len(values):
+            lo = np.minimum(lo, values.min(axis=0))
+            hi = np.maximum(hi, values.max(axis=0))
+
+    if not np.all(np.isfinite(lo)):
+        return None, None, None
+    hi = np.where(hi > lo, hi, lo + 1)
+
+    x_edges = np.linspace(lo[0], hi[0], bins + 1)
+    y_edges = np.linspace(lo[1], hi[1], bins + 1)
+    counts = np.zeros((bins, bins), dtype=np.int64)
+
+    # 2ª passada: acumula as contagens
+    for chunk in iter_metric_chunks(source, cols, chunksize):
+        values = transform(chunk)
+        if len(values):
+            h, _, _ = np.histogram2d(values[:, 0], values[:, 1], bins=[x_edges, y_edges])
+            counts += h.astype(np.int64)
+
+    return counts, x_edges, y_edges
+
+def density_quantile_trend(counts, y_edges, quantiles=(0.25, 0.5, 0.75), min_count=20):
+    """Estima os quantis de y em cada coluna de x diretamente do histograma 2D."""
+    nx, ny = counts.shape
+    totals = counts.sum(axis=1)
+    cumulative = np.cumsum(counts, axis=1)
+    rows = np.arange(nx)
+
+    trends = {}
+    for q in quantiles:
+        target = q * totals
+        idx = np.clip((cumulative < target[:, None]).sum(axis=1), 0, ny - 1)
+        before = np.where(idx > 0, cumulative[rows, np.maximum(idx - 1, 0)], 0)
+        in_bin = counts[rows, idx]
+        frac = np.divide(target - before, in_bin, out=np.zeros(nx), where=in_bin > 0)
+        values = y_edges[idx] + frac * (y_edges[idx + 1] - y_edges[idx])
+        values[totals < min_count] = np.nan
+        trends[q] = values
+    return trends
+
+def _set_log_ticks(axis, edges):
+    """Marca potências de 10 no eixo transformado, rotuladas na escala original."""
+    lo, hi = _inverse_log_transform(np.array([edges[0], edges[-1]]))
+    top = int(np.ceil(np.log10(max(abs(lo), abs(hi), 1))))
+    candidates = np.array([0] + [s * 10 ** k for k in range(top + 1) for s in (1, -1)], dtype=float)
+    ticks = np.sort(candidates[(candidates >= lo) & (candidates <= hi)])
+    axis.set_ticks(_log_transform(ticks))
+    axis.set_ticklabels([f"{t:,.0f}" for t in ticks])
+
+def plot_density_research_question(source, x_var, y_var, title, x_label, y_label, filename,
+                                   mode='hist2d', bins=200, gridsize=60, log_scale=(True, True),
+                                   quantiles=(0.25, 0.5, 0.75), chunksize=500_000):
+    """
+    Versão por densidade do gráfico de dispersão, para os níveis de classe e método
+    (class.csv/method.csv). `source` pode ser um DataFrame ou o caminho de um CSV.
+    `mode` aceita 'hist2d' ou 'hexbin'; a tendência dos quantis é sobreposta.
+    """
+    counts, x_edges, y_edges = compute_density_grid(source, x_var, y_var, bins, log_scale, chunksize)
+    if counts is None:
+        print(f"AVISO: Nenhum dado numérico para '{x_var}' x '{y_var}'.")
+        return
+
+    plt.figure(figsize=(8, 6))
+    ax = plt.gca()
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+
+    if mode == 'hexbin':
+        # Re-agrega a grade fina em hexágonos, ponderando cada célula pela sua contagem
+        xx, yy = np.meshgrid(x_centers, y_centers, indexing='ij')
+        mask = counts > 0
+        image = ax.hexbin(xx[mask], yy[mask], C=counts[mask], reduce_C_function=np.sum,
+                          gridsize=gridsize, bins='log', cmap='viridis',
+                          extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]))
+    elif mode == 'hist2d':
+        image = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0),
+                              norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)), cmap='viridis')
+    else:
+        raise ValueError(f"Modo de densidade desconhecido: '{mode}'")
+    plt.colorbar(image, ax=ax, label='Quantidade (escala log)')
+
+    trends = density_quantile_trend(counts, y_edges, quantiles)
+    for q, values in trends.items():
+        ax.plot(x_centers, values, color='red', linewidth=2 if q == 0.5 else 1,
+                linestyle='-' if q == 0.5 else '--', label=f'Quantil {q:.2f}')
+    ax.legend(loc='upper left', fontsize=9)
+
+    if log_scale[0]:
+        _set_log_ticks(ax.xaxis, x_edges)
+    if log_scale[1]:
+        _set_log_ticks(ax.yaxis, y_edges)
+
+    ax.set_title(title, fontsize=14)
+    ax.set_xlabel(x_label, fontsize=12)
+    ax.set_ylabel(y_label, fontsize=12)
+
+    plt.tight_layout()
+    plt.savefig(filename, dpi=300)
+    plt.show()
+    print(f"Gráfico salvo como '{filename}'")
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gera as estatísticas e os gráficos a partir de 'metricas.csv'.")
+    parser.add_argument('--fila', default='./data/fila.sqlite',
+                        help="Banco SQLite da fila do script 2 (o mesmo de --fila lá), para saber se a coleta terminou.")
+    args = parser.parse_args()
+
     sns.set_theme(style="whitegrid", palette="viridis")
 
     # Carrega e prepara os dados
-    df_analysis = load_and_merge_data()
+    df_analysis = load_and_merge_data(queue_path=args.fila)
 
     if df_analysis is not None:
         # Define as colunas de interesse
@@ -152,4 +416,25 @@ if __name__ == '__main__':
                     filename=filename,
                     x_scale=params.get('x_scale'),
                     x_scale_params=params.get('x_scale_params')
-                )
\ No newline at end of file
+                )
+
+        # Visões por classe e por método: muitos pontos, então usa densidade em vez de dispersão
+        ck_level_configs = [
+            ('./data/class.csv', 'loc', 'cbo', 'Classes', 'Tamanho (LOC)', 'CBO', 'densidade_classe_cbo.png'),
+            ('./data/class.csv', 'loc', 'lcom', 'Classes', 'Tamanho (LOC)', 'LCOM', 'densidade_classe_lcom.png'),
+            ('./data/method.csv', 'loc', 'wmc', 'Métodos', 'Tamanho (LOC)', 'WMC', 'densidade_metodo_wmc.png'),
+        ]
+        for path, x_var, y_var, level, x_label, y_label, filename in ck_level_configs:
+            if not Path(path).exists():
+                print(f"AVISO: '{path}' não encontrado. Pulando gráfico por densidade.")
+                continue
+            plot_density_research_question(
+                source=path,
+                x_var=x_var,
+                y_var=y_var,
+                title=f'{level}: {y_label} vs. {x_label}',
+                x_label=x_label,
+                y_label=y_label,
+                filename=filename,
+                mode='hexbin'
+            )
@@ -0,0 +1,160 @@
+# admissao.py
+"""
+Controle de admissão de clones e execuções do CK, por máquina.
+
+Antes de clonar ou de subir uma JVM, o worker reserva o espaço em disco e a
+memória estimados. A reserva só é concedida se couber no que está livre agora,
+descontando as demais reservas desta máquina (inclusive as dos CKs paralelos
+do mesmo worker) e uma margem de segurança; caso contrário o worker espera na
+fila. Um job que não caberia nem com a máquina livre dos outros jobs falha com
+`RecursosInsuficientes`, para ser reprocessado seletivamente depois. Quem
+espera pela JVM não pode segurar memória de uma etapa que já terminou: o clone
+devolve a RAM reservada (`libera_ram`) antes do CK, e fica só com o disco. As
+reservas ficam em um SQLite local, então processos diferentes enxergam o mesmo
+orçamento, e reservas de processos que morreram são descartadas automaticamente.
+"""
+import os
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+INTERVALO_ESPERA = 5
+
+
+class RecursosInsuficientes(RuntimeError):
+    """O job não cabe no disco ou na memória desta máquina nem sem outros jobs rodando."""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reservas (
+    worker    TEXT NOT NULL,
+    tipo      TEXT NOT NULL,
+    pid       INTEGER NOT NULL,
+    disco_mb  REAL NOT NULL,
+    ram_mb    REAL NOT NULL,
+    criada_em REAL NOT NULL,
+    PRIMARY KEY (worker, tipo)
+);
+"""
+
+
+def conecta(db_path: Path) -> sqlite3.Connection:
+    """Abre o banco local de reservas."""
+    conn = sqlite3.connect(str(db_path), timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=60000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def disco_livre_mb(path: Path) -> float:
+    return shutil.disk_usage(path).free / 2**20
+
+
+def ram_disponivel_mb() -> Optional[float]:
+    """Memória disponível (MemAvailable no Linux). Retorna None se não for possível medir."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for linha in meminfo:
+                if linha.startswith("MemAvailable:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _processo_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def tenta_admitir(conn: sqlite3.Connection, path_disco: Path, worker: str, tipo: str,
+                  disco_mb: float, ram_mb: float, margem_disco_mb: float, margem_ram_mb: float) -> bool:
+    """
+    Reserva os recursos se couberem. Operação atômica entre os processos da máquina.
+    Levanta RecursosInsuficientes se o pedido não couber nem com todas as outras reservas liberadas.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        mortos = [
+            (w, t) for w, t, pid in conn.execute("SELECT worker, tipo, pid FROM reservas")
+            if not _processo_vivo(pid)
+        ]
+        conn.executemany("DELETE FROM reservas WHERE worker = ? AND tipo = ?", mortos)
+
+        outras = conn.execute(
+            "SELECT worker, tipo, disco_mb, ram_mb FROM reservas WHERE NOT (worker = ? AND tipo = ?)",
+            (worker, tipo),
+        ).fetchall()
+        # Todas as outras reservas entram no orçamento, inclusive as do próprio worker. As do
+        # próprio worker com outro prefixo de tipo (o clone que envolve este CK) não são liberadas
+        # enquanto esta espera; as de mesmo prefixo (CKs paralelos de outras revisões) são.
+        prefixo = tipo.split(":")[0]
+        liberaveis = [r for r in outras if r[0] != worker or r[1].split(":")[0] == prefixo]
+        disco_reservado, ram_reservada = sum(r[2] for r in outras), sum(r[3] for r in outras)
+        disco_liberavel, ram_liberavel = sum(r[2] for r in liberaveis), sum(r[3] for r in liberaveis)
+
+        # A medição atual já inclui parte do que os outros jobs consumiram,
+        # então descontar a reserva inteira deles é conservador.
+        disco = disco_livre_mb(path_disco)
+        ram = ram_disponivel_mb()
+        cabe_disco = disco_mb == 0 or disco - disco_reservado - margem_disco_mb >= disco_mb
+        cabe_ram = ram is None or ram_mb == 0 or ram - ram_reservada - margem_ram_mb >= ram_mb
+        # Pelo mesmo motivo, somar as reservas liberáveis ao que está livre é otimista:
+        # só desiste de jobs que não caberiam de jeito nenhum
+        impossivel = disco + disco_liberavel < disco_mb or (ram is not None and ram + ram_liberavel < ram_mb)
+
+        # Sem nenhuma reserva que possa ser liberada, admite mesmo o que só não cabe na margem de segurança
+        admitido = not impossivel and ((cabe_disco and cabe_ram) or not liberaveis)
+        if admitido:
+            conn.execute(
+                "INSERT OR REPLACE INTO reservas (worker, tipo, pid, disco_mb, ram_mb, criada_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (worker, tipo, os.getpid(), disco_mb, ram_mb, time.time()),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if impossivel:
+        raise RecursosInsuficientes(
+            f"{tipo} precisa de {disco_mb:.0f} MB de disco e {ram_mb:.0f} MB de RAM; a máquina tem "
+            f"{disco + disco_liberavel:.0f} MB de disco e "
+            f"{'?' if ram is None else f'{ram + ram_liberavel:.0f}'} MB de RAM mesmo sem outros jobs."
+        )
+    return admitido
+
+
+def aguarda_admissao(conn: sqlite3.Connection, path_disco: Path, worker: str, tipo: str,
+                     disco_mb: float, ram_mb: float, margem_disco_mb: float, margem_ram_mb: float,
+                     ao_esperar: Optional[Callable[[], None]] = None):
+    """
+    Bloqueia até que a reserva seja concedida. `ao_esperar` é chamado a cada tentativa negada.
+    Levanta RecursosInsuficientes se o pedido nunca couber nesta máquina.
+    """
+    avisou = False
+    while not tenta_admitir(conn, path_disco, worker, tipo, disco_mb, ram_mb, margem_disco_mb, margem_ram_mb):
+        if not avisou:
+            print(f"  Aguardando recursos para {tipo} ({disco_mb:.0f} MB de disco, {ram_mb:.0f} MB de RAM)...")
+            avisou = True
+        if ao_esperar:
+            ao_esperar()
+        time.sleep(INTERVALO_ESPERA)
+
+
+def libera(conn: sqlite3.Connection, worker: str, tipo: str):
+    conn.execute("DELETE FROM reservas WHERE worker = ? AND tipo = ?", (worker, tipo))
+
+
+def libera_ram(conn: sqlite3.Connection, worker: str, tipo: str):
+    """Devolve só a memória da reserva (ex.: o git clone terminou, mas o checkout continua em disco)."""
+    conn.execute("UPDATE reservas SET ram_mb = 0 WHERE worker = ? AND tipo = ?", (worker, tipo))
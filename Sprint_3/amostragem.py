@@ -0,0 +1,65 @@
+# amostragem.py
+"""
+Amostragem estratificada dos repositórios de 'repos.csv' para a prévia do relatório.
+
+Os estratos cruzam quantis de popularidade (estrelas) e de tamanho (diskUsage).
+O script 2 usa `amostra_estratificada` para analisar primeiro uma amostra
+representativa; o script 3 usa `estratos` para ponderar as estimativas e
+calcular as margens de erro enquanto o restante da fila não termina.
+"""
+import numpy as np
+import pandas as pd
+
+N_QUANTIS = 4
+SEMENTE = 42
+
+
+def _quantis(valores: pd.Series, n_quantis: int) -> pd.Series:
+    # rank antes do qcut para que valores empatados não gerem bordas de quantil repetidas
+    validos = valores.notna()
+    grupos = pd.Series(0, index=valores.index)
+    if validos.sum() >= n_quantis:
+        grupos[validos] = pd.qcut(valores[validos].rank(method="first"), n_quantis, labels=False)
+    return grupos.astype(int)
+
+
+def estratos(df_repos: pd.DataFrame, n_quantis: int = N_QUANTIS) -> pd.Series:
+    """Rótulo do estrato de cada repositório: '<quantil de estrelas>-<quantil de tamanho>'."""
+    estrelas = _quantis(df_repos["stars_count"], n_quantis)
+    if "disk_usage_kb" in df_repos.columns:
+        tamanho = _quantis(df_repos["disk_usage_kb"], n_quantis)
+    else:
+        tamanho = pd.Series(0, index=df_repos.index)
+    return estrelas.astype(str) + "-" + tamanho.astype(str)
+
+
+def amostra_estratificada(df_repos: pd.DataFrame, n: int, n_quantis: int = N_QUANTIS,
+                          semente: int = SEMENTE) -> pd.DataFrame:
+    """
+    Sorteia exatamente `n` repositórios com alocação proporcional ao tamanho de cada
+    estrato, mantendo a ordem original de 'repos.csv'. Cada estrato recebe ao menos
+    um repositório; se `n` for menor que o número de estratos, entram só os `n`
+    maiores estratos, com um repositório cada (os demais ficam fora da prévia).
+    """
+    if n >= len(df_repos):
+        return df_repos
+
+    rotulos = estratos(df_repos, n_quantis)
+    tamanhos = rotulos.value_counts()
+    if n < len(tamanhos):
+        alocacao = pd.Series(1, index=tamanhos.index[:n])
+    else:
+        cota = tamanhos / len(df_repos) * n
+        alocacao = np.maximum(np.floor(cota), 1).astype(int)
+        # O mínimo de um por estrato pode passar de n: tira vagas dos estratos mais acima da cota
+        while alocacao.sum() > n:
+            alocacao[(alocacao - cota)[alocacao > 1].idxmax()] -= 1
+        # Distribui as vagas restantes pelos estratos mais abaixo da cota, sem passar do tamanho de cada um
+        while alocacao.sum() < n:
+            alocacao[(cota - alocacao)[alocacao < tamanhos].idxmax()] += 1
+
+    indices = []
+    for rotulo, quantidade in alocacao.items():
+        membros = df_repos[rotulos == rotulo]
+        indices.extend(membros.sample(n=quantidade, random_state=semente).index)
+    return df_repos.loc[sorted(indices)]
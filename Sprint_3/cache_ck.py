@@ -0,0 +1,215 @@
+# cache_ck.py
+"""
+Cache de resultados do CK entre repositórios, indexado pelos blobs do git.
+
+Forks, espelhos e código copiado (bibliotecas embutidas, tutoriais) fazem com
+que o mesmo arquivo .java apareça em muitos repositórios. O git já identifica
+cada arquivo pelo SHA do seu conteúdo, então guardamos:
+
+- as linhas do 'class.csv' e do 'method.csv' de cada blob já analisado, sem o caminho;
+- as métricas agregadas de cada árvore Java completa (hash de todos os pares
+  caminho/blob), para pular o CK em repositórios idênticos a um já analisado; e
+- o commit, a lista caminho/blob e as linhas de cada arquivo na última análise
+  de cada repositório, para que uma atualização rode o CK só nos arquivos que
+  mudaram desde então (e nos que dependem deles). Essas linhas são do próprio
+  repositório: as da tabela de blobs podem ter sido calculadas no contexto de
+  outro repositório, com outros supertipos e dependências.
+"""
+import hashlib
+import json
+import sqlite3
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+LOTE_CONSULTA = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS arvores (
+    hash        TEXT PRIMARY KEY,
+    repo_origem TEXT NOT NULL,
+    metricas    TEXT NOT NULL,
+    criada_em   REAL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha         TEXT PRIMARY KEY,
+    linhas      TEXT NOT NULL,
+    metodos     TEXT,
+    criado_em   REAL
+);
+CREATE TABLE IF NOT EXISTS estado_repos (
+    full_name     TEXT PRIMARY KEY,
+    commit_sha    TEXT NOT NULL,
+    manifest      TEXT NOT NULL,
+    atualizado_em REAL
+);
+CREATE TABLE IF NOT EXISTS arquivos_repos (
+    full_name   TEXT NOT NULL,
+    caminho     TEXT NOT NULL,
+    sha         TEXT NOT NULL,
+    linhas      TEXT NOT NULL,
+    metodos     TEXT NOT NULL,
+    PRIMARY KEY (full_name, caminho)
+);
+"""
+
+
+def _json_default(valor):
+    # Converte escalares do numpy/pandas (int64, float64) para tipos nativos
+    if hasattr(valor, "item"):
+        return valor.item()
+    return str(valor)
+
+
+def conecta(db_path: Path) -> sqlite3.Connection:
+    """Abre o banco do cache em modo WAL e cria as tabelas se necessário."""
+    conn = sqlite3.connect(str(db_path), timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=60000")
+    if "repo_name" in {row[1] for row in conn.execute("PRAGMA table_info(estado_repos)")}:
+        # Estado indexado pelo nome curto, que se repete entre donos: descartado, e a
+        # próxima atualização de cada repositório volta a ser completa
+        conn.execute("DROP TABLE estado_repos")
+    conn.executescript(SCHEMA)
+    colunas = {row[1] for row in conn.execute("PRAGMA table_info(blobs)")}
+    if "metodos" not in colunas:
+        # Caches criados antes de guardar o 'method.csv'
+        conn.execute("ALTER TABLE blobs ADD COLUMN metodos TEXT")
+    return conn
+
+
+def java_manifest(path_repo: Path) -> Optional[List[Tuple[str, str]]]:
+    """Lista (caminho relativo, SHA do blob) dos arquivos .java versionados, direto do índice do git."""
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(path_repo), "ls-files", "-s", "-z", "--", "*.java"],
+            check=True, capture_output=True, text=True, encoding="utf-8", errors="replace", timeout=120
+        )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        print(f"  AVISO: Não foi possível listar os blobs de {path_repo.name}. Erro: {e}")
+        return None
+
+    manifest = []
+    # Formato de cada entrada: "<modo> <sha> <estágio>\t<caminho>"
+    for entrada in result.stdout.split("\0"):
+        if not entrada:
+            continue
+        meta, caminho = entrada.split("\t", 1)
+        manifest.append((caminho, meta.split()[1]))
+    return manifest
+
+
+def hash_arvore(manifest: Iterable[Tuple[str, str]]) -> str:
+    """Identificador da árvore Java: muda se qualquer arquivo for adicionado, removido ou alterado."""
+    digest = hashlib.sha1()
+    for caminho, sha in sorted(manifest):
+        digest.update(f"{sha} {caminho}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def busca_arvore(conn: sqlite3.Connection, hash_: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute("SELECT repo_origem, metricas FROM arvores WHERE hash = ?", (hash_,)).fetchone()
+    if row is None:
+        return None
+    metricas = json.loads(row[1])
+    metricas["_repo_origem"] = row[0]
+    return metricas
+
+
+def salva_arvore(conn: sqlite3.Connection, hash_: str, repo_origem: str, metricas: Dict[str, Any]):
+    conn.execute(
+        "INSERT OR IGNORE INTO arvores (hash, repo_origem, metricas, criada_em) VALUES (?, ?, ?, ?)",
+        (hash_, repo_origem, json.dumps(metricas, default=_json_default), time.time()),
+    )
+
+
+def busca_blobs(conn: sqlite3.Connection, shas: Iterable[str]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """
+    Retorna as linhas já conhecidas para cada SHA, como {"classes": [...], "metodos": [...]}.
+    Blobs gravados sem o 'method.csv' são tratados como não analisados.
+    """
+    shas = list(shas)
+    encontrados = {}
+    for inicio in range(0, len(shas), LOTE_CONSULTA):
+        lote = shas[inicio:inicio + LOTE_CONSULTA]
+        rows = conn.execute(
+            f"SELECT sha, linhas, metodos FROM blobs "
+            f"WHERE metodos IS NOT NULL AND sha IN ({','.join('?' * len(lote))})", lote
+        )
+        encontrados.update(
+            (sha, {"classes": json.loads(linhas), "metodos": json.loads(metodos)})
+            for sha, linhas, metodos in rows
+        )
+    return encontrados
+
+
+def salva_blobs(conn: sqlite3.Connection, linhas_por_sha: Dict[str, Dict[str, List[Dict[str, Any]]]]):
+    """Grava (ou substitui, quando o blob foi reanalisado) as linhas de classe e método de cada SHA."""
+    agora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(
+        "INSERT OR REPLACE INTO blobs (sha, linhas, metodos, criado_em) VALUES (?, ?, ?, ?)",
+        [
+            (sha, json.dumps(linhas["classes"], default=_json_default),
+             json.dumps(linhas["metodos"], default=_json_default), agora)
+            for sha, linhas in linhas_por_sha.items()
+        ],
+    )
+    conn.execute("COMMIT")
+
+
+def busca_estado(conn: sqlite3.Connection, full_name: str) -> Optional[Dict[str, Any]]:
+    """Commit e lista caminho/blob da última análise do repositório, se houver."""
+    row = conn.execute(
+        "SELECT commit_sha, manifest FROM estado_repos WHERE full_name = ?", (full_name,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"commit_sha": row[0], "manifest": [tuple(item) for item in json.loads(row[1])]}
+
+
+def salva_estado(conn: sqlite3.Connection, full_name: str, commit_sha: str, manifest: List[Tuple[str, str]]):
+    conn.execute(
+        "INSERT OR REPLACE INTO estado_repos (full_name, commit_sha, manifest, atualizado_em) VALUES (?, ?, ?, ?)",
+        (full_name, commit_sha, json.dumps(manifest), time.time()),
+    )
+
+
+def busca_arquivos_repo(conn: sqlite3.Connection, full_name: str) -> Dict[str, Dict[str, Any]]:
+    """Linhas de classe e método de cada caminho na última análise do repositório, com o SHA do blob."""
+    rows = conn.execute(
+        "SELECT caminho, sha, linhas, metodos FROM arquivos_repos WHERE full_name = ?", (full_name,)
+    )
+    return {
+        caminho: {"sha": sha, "classes": json.loads(linhas), "metodos": json.loads(metodos)}
+        for caminho, sha, linhas, metodos in rows
+    }
+
+
+def salva_arquivos_repo(conn: sqlite3.Connection, full_name: str, linhas_por_caminho: Dict[str, Dict[str, Any]]):
+    """Substitui as linhas guardadas do repositório pelas desta análise."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM arquivos_repos WHERE full_name = ?", (full_name,))
+        conn.executemany(
+            "INSERT INTO arquivos_repos (full_name, caminho, sha, linhas, metodos) VALUES (?, ?, ?, ?, ?)",
+            [
+                (full_name, caminho, linhas["sha"], json.dumps(linhas["classes"], default=_json_default),
+                 json.dumps(linhas["metodos"], default=_json_default))
+                for caminho, linhas in linhas_por_caminho.items()
+            ],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def diff_manifests(anterior: List[Tuple[str, str]], atual: List[Tuple[str, str]]) -> Tuple[List[str], List[str]]:
+    """Caminhos alterados ou adicionados, e caminhos removidos, entre duas análises."""
+    antes = dict(anterior)
+    depois = dict(atual)
+    alterados = [caminho for caminho, sha in atual if antes.get(caminho) != sha]
+    removidos = [caminho for caminho in antes if caminho not in depois]
+    return alterados, removidos
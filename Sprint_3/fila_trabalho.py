@@ -0,0 +1,315 @@
+# fila_trabalho.py
+"""
+Fila de trabalho persistente (SQLite em modo WAL) para o script 2.
+
+Cada repositório é uma tarefa. Workers reservam tarefas com um lease de tempo
+limitado; leases expirados voltam para a fila. Resultados e falhas ficam
+registrados no mesmo banco, então a execução pode ser retomada, falhas podem
+ser reprocessadas seletivamente e vários processos/máquinas podem consumir a
+mesma fila (desde que o sistema de arquivos compartilhado suporte locks do SQLite).
+
+Tarefas, resultados e revisões são identificados pelo 'full_name' (dono/nome):
+o nome curto se repete entre donos (ex.: TheAlgorithms/Java e DuGuQiuBai/Java)
+e serve só para exibição e nomes de diretório.
+"""
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+PENDENTE = "pendente"
+RESERVADO = "reservado"
+CONCLUIDO = "concluido"
+FALHOU = "falhou"
+
+LEASE_PADRAO = 1200
+MAX_TENTATIVAS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tarefas (
+    full_name     TEXT PRIMARY KEY,
+    repo_name     TEXT NOT NULL,
+    url           TEXT NOT NULL,
+    tamanho_kb    REAL,
+    status        TEXT NOT NULL DEFAULT 'pendente',
+    tentativas    INTEGER NOT NULL DEFAULT 0,
+    worker        TEXT,
+    lease_expira  REAL,
+    erro_classe   TEXT,
+    erro_mensagem TEXT,
+    atualizado_em REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tarefas_status ON tarefas(status);
+CREATE TABLE IF NOT EXISTS resultados (
+    full_name     TEXT PRIMARY KEY,
+    metricas      TEXT NOT NULL,
+    worker        TEXT,
+    concluido_em  REAL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    full_name     TEXT NOT NULL,
+    revisao       TEXT NOT NULL,
+    sha           TEXT,
+    metricas      TEXT NOT NULL,
+    concluido_em  REAL,
+    PRIMARY KEY (full_name, revisao)
+);
+"""
+
+
+def _json_default(valor):
+    # Converte escalares do numpy/pandas (int64, float64) para tipos nativos
+    if hasattr(valor, "item"):
+        return valor.item()
+    return str(valor)
+
+
+def conecta(db_path: Path) -> sqlite3.Connection:
+    """Abre o banco da fila em modo WAL e cria as tabelas se necessário."""
+    conn = sqlite3.connect(str(db_path), timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=60000")
+    conn.executescript(SCHEMA)
+    colunas = {row["name"]: row["pk"] for row in conn.execute("PRAGMA table_info(tarefas)")}
+    if "tamanho_kb" not in colunas:
+        # Filas criadas antes da coluna de tamanho
+        conn.execute("ALTER TABLE tarefas ADD COLUMN tamanho_kb REAL")
+    if not colunas.get("full_name"):
+        _migra_chave_full_name(conn)
+    return conn
+
+
+def conecta_leitura(db_path: Path) -> sqlite3.Connection:
+    """Abre a fila só para leitura (ex.: relatórios): não cria tabelas, não migra e não muda o journal."""
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=60)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _migra_chave_full_name(conn: sqlite3.Connection):
+    """Filas criadas com a chave no nome curto: recria as tabelas com a chave no 'full_name'."""
+    def colunas(tabela):
+        return {row["name"]: row["pk"] for row in conn.execute(f"PRAGMA table_info({tabela})")}
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if colunas("tarefas").get("full_name"):
+            # Outro processo migrou enquanto este esperava o lock
+            conn.execute("COMMIT")
+            return
+        # Tabelas que ainda não existiam na fila antiga já foram criadas com a chave nova
+        antigas = ["tarefas"] + [t for t in ("resultados", "snapshots") if "full_name" not in colunas(t)]
+        conn.execute("DROP INDEX IF EXISTS idx_tarefas_status")
+        for tabela in antigas:
+            conn.execute(f"ALTER TABLE {tabela} RENAME TO {tabela}_antiga")
+        # executescript faria COMMIT no meio da migração; cria as tabelas uma a uma
+        for comando in SCHEMA.split(";"):
+            if comando.strip():
+                conn.execute(comando)
+        conn.execute(
+            "INSERT INTO tarefas (full_name, repo_name, url, tamanho_kb, status, tentativas, worker, lease_expira, "
+            "erro_classe, erro_mensagem, atualizado_em) "
+            "SELECT COALESCE(full_name, repo_name), repo_name, url, tamanho_kb, status, tentativas, worker, "
+            "lease_expira, erro_classe, erro_mensagem, atualizado_em FROM tarefas_antiga ORDER BY rowid"
+        )
+        if "resultados" in antigas:
+            conn.execute(
+                "INSERT INTO resultados (full_name, metricas, worker, concluido_em) "
+                "SELECT COALESCE(t.full_name, r.repo_name), r.metricas, r.worker, r.concluido_em "
+                "FROM resultados_antiga r LEFT JOIN tarefas_antiga t ON t.repo_name = r.repo_name"
+            )
+        if "snapshots" in antigas:
+            conn.execute(
+                "INSERT INTO snapshots (full_name, revisao, sha, metricas, concluido_em) "
+                "SELECT COALESCE(t.full_name, s.repo_name), s.revisao, s.sha, s.metricas, s.concluido_em "
+                "FROM snapshots_antiga s LEFT JOIN tarefas_antiga t ON t.repo_name = s.repo_name ORDER BY s.rowid"
+            )
+        for tabela in antigas:
+            conn.execute(f"DROP TABLE {tabela}_antiga")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _tamanho_kb(repo: Dict[str, Any]) -> Optional[float]:
+    valor = repo.get("disk_usage_kb")
+    # Linhas sem o tamanho vêm do pandas como NaN
+    return None if valor is None or valor != valor else float(valor)
+
+
+def enfileira_repos(conn: sqlite3.Connection, repos: Iterable[Dict[str, Any]]) -> int:
+    """Adiciona repositórios à fila. Repositórios já conhecidos (mesmo 'full_name') são ignorados."""
+    agora = time.time()
+    antes = conn.total_changes
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(
+        "INSERT OR IGNORE INTO tarefas (full_name, repo_name, url, tamanho_kb, status, atualizado_em) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(r["full_name"], r["repo_name"], r["url"], _tamanho_kb(r), PENDENTE, agora) for r in repos],
+    )
+    conn.execute("COMMIT")
+    return conn.total_changes - antes
+
+
+def _libera_leases_expirados(conn: sqlite3.Connection, agora: float, max_tentativas: int):
+    conn.execute(
+        "UPDATE tarefas SET status = ?, worker = NULL, lease_expira = NULL, "
+        "erro_classe = 'LeaseExpirado', erro_mensagem = 'Lease expirou após ' || tentativas || ' tentativa(s).', "
+        "atualizado_em = ? "
+        "WHERE status = ? AND lease_expira < ? AND tentativas >= ?",
+        (FALHOU, agora, RESERVADO, agora, max_tentativas),
+    )
+    conn.execute(
+        "UPDATE tarefas SET status = ?, worker = NULL, lease_expira = NULL, atualizado_em = ? "
+        "WHERE status = ? AND lease_expira < ?",
+        (PENDENTE, agora, RESERVADO, agora),
+    )
+
+
+def reserva_proxima(conn: sqlite3.Connection, worker: str, lease: float = LEASE_PADRAO,
+                    max_tentativas: int = MAX_TENTATIVAS) -> Optional[Dict[str, Any]]:
+    """Reserva a próxima tarefa pendente para `worker`. Retorna None se a fila estiver vazia."""
+    agora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _libera_leases_expirados(conn, agora, max_tentativas)
+        row = conn.execute(
+            "SELECT * FROM tarefas WHERE status = ? ORDER BY rowid LIMIT 1", (PENDENTE,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE tarefas SET status = ?, worker = ?, lease_expira = ?, "
+            "tentativas = tentativas + 1, atualizado_em = ? WHERE full_name = ?",
+            (RESERVADO, worker, agora + lease, agora, row["full_name"]),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return dict(row)
+
+
+def renova_lease(conn: sqlite3.Connection, full_name: str, worker: str, lease: float = LEASE_PADRAO) -> bool:
+    """Estende o lease de uma tarefa. Retorna False se o worker já perdeu a reserva."""
+    cur = conn.execute(
+        "UPDATE tarefas SET lease_expira = ?, atualizado_em = ? "
+        "WHERE full_name = ? AND worker = ? AND status = ?",
+        (time.time() + lease, time.time(), full_name, worker, RESERVADO),
+    )
+    return cur.rowcount == 1
+
+
+def conclui(conn: sqlite3.Connection, full_name: str, worker: str, metricas: Dict[str, Any],
+            snapshots: Optional[List[Dict[str, Any]]] = None) -> bool:
+    """
+    Registra o sucesso de uma tarefa e suas métricas, se o worker ainda detém o lease.
+    `snapshots` são as métricas por revisão histórica, gravadas na mesma transação.
+    """
+    agora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    cur = conn.execute(
+        "UPDATE tarefas SET status = ?, lease_expira = NULL, erro_classe = NULL, "
+        "erro_mensagem = NULL, atualizado_em = ? WHERE full_name = ? AND worker = ? AND status = ?",
+        (CONCLUIDO, agora, full_name, worker, RESERVADO),
+    )
+    if cur.rowcount != 1:
+        conn.execute("ROLLBACK")
+        return False
+    conn.execute(
+        "INSERT OR REPLACE INTO resultados (full_name, metricas, worker, concluido_em) VALUES (?, ?, ?, ?)",
+        (full_name, json.dumps(metricas, default=_json_default), worker, agora),
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO snapshots (full_name, revisao, sha, metricas, concluido_em) VALUES (?, ?, ?, ?, ?)",
+        [(full_name, snap["revisao"], snap.get("sha"), json.dumps(snap, default=_json_default), agora)
+         for snap in snapshots or []],
+    )
+    conn.execute("COMMIT")
+    return True
+
+
+def registra_falha(conn: sqlite3.Connection, full_name: str, worker: str,
+                   erro_classe: str, erro_mensagem: str = "") -> bool:
+    """Marca a tarefa como falha, guardando a classe do erro para reprocessamento seletivo."""
+    cur = conn.execute(
+        "UPDATE tarefas SET status = ?, lease_expira = NULL, erro_classe = ?, erro_mensagem = ?, "
+        "atualizado_em = ? WHERE full_name = ? AND worker = ? AND status = ?",
+        (FALHOU, erro_classe, erro_mensagem[:2000], time.time(), full_name, worker, RESERVADO),
+    )
+    return cur.rowcount == 1
+
+
+def reprocessa_falhas(conn: sqlite3.Connection, erro_classes: Optional[List[str]] = None) -> int:
+    """Devolve tarefas com falha para a fila, opcionalmente filtrando pela classe do erro."""
+    sql = "UPDATE tarefas SET status = ?, worker = NULL, tentativas = 0, atualizado_em = ? WHERE status = ?"
+    params: List[Any] = [PENDENTE, time.time(), FALHOU]
+    if erro_classes:
+        sql += f" AND erro_classe IN ({','.join('?' * len(erro_classes))})"
+        params.extend(erro_classes)
+    return conn.execute(sql, params).rowcount
+
+
+def reabre_concluidos(conn: sqlite3.Connection) -> int:
+    """Devolve tarefas concluídas para a fila, para uma nova rodada de atualização."""
+    return conn.execute(
+        "UPDATE tarefas SET status = ?, worker = NULL, tentativas = 0, atualizado_em = ? WHERE status = ?",
+        (PENDENTE, time.time(), CONCLUIDO),
+    ).rowcount
+
+
+def busca_resultado(conn: sqlite3.Connection, full_name: str) -> Optional[Dict[str, Any]]:
+    """Métricas da última análise bem-sucedida do repositório, se houver."""
+    row = conn.execute("SELECT metricas FROM resultados WHERE full_name = ?", (full_name,)).fetchone()
+    return json.loads(row["metricas"]) if row else None
+
+
+def resumo(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Contagem de tarefas por status e por classe de erro."""
+    contagem = {
+        row["status"]: row["n"]
+        for row in conn.execute("SELECT status, COUNT(*) AS n FROM tarefas GROUP BY status")
+    }
+    for row in conn.execute(
+        "SELECT erro_classe, COUNT(*) AS n FROM tarefas WHERE status = ? GROUP BY erro_classe", (FALHOU,)
+    ):
+        contagem[f"{FALHOU}:{row['erro_classe']}"] = row["n"]
+    return contagem
+
+
+def em_aberto(conn: sqlite3.Connection, full_names: Iterable[str]) -> List[str]:
+    """
+    Repositórios ainda sem desfecho na fila: nunca enfileirados, ou pendentes/reservados sem
+    nenhum resultado anterior. Concluídos, falhas e reabertos para atualização contam como finalizados.
+    """
+    finalizados = {
+        row["full_name"] for row in conn.execute(
+            "SELECT full_name FROM resultados UNION SELECT full_name FROM tarefas WHERE status = ?", (FALHOU,)
+        )
+    }
+    return [full_name for full_name in full_names if full_name not in finalizados]
+
+
+def exporta_resultados(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """
+    Retorna as métricas da última análise bem-sucedida de cada repositório, na ordem da fila.
+    Repositórios reabertos para atualização continuam com o resultado anterior até serem concluídos.
+    """
+    rows = conn.execute(
+        "SELECT r.full_name, r.metricas FROM resultados r JOIN tarefas t ON t.full_name = r.full_name "
+        "ORDER BY t.rowid"
+    )
+    return [{"full_name": row["full_name"], **json.loads(row["metricas"])} for row in rows]
+
+
+def exporta_snapshots(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Retorna as métricas de cada (repositório, revisão) analisados no modo histórico."""
+    rows = conn.execute(
+        "SELECT s.full_name, s.metricas FROM snapshots s JOIN tarefas t ON t.full_name = s.full_name "
+        "ORDER BY t.rowid, s.rowid"
+    )
+    return [{"full_name": row["full_name"], **json.loads(row["metricas"])} for row in rows]
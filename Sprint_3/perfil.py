@@ -0,0 +1,146 @@
+# perfil.py
+"""
+Profiling opcional do lado Python do script 2, por etapa e por repositório.
+
+Cada etapa (clone, varredura da árvore, CK, leitura do 'class.csv', remoção...)
+é envolvida por `etapa(nome)`. Fora do modo de profiling, ou para repositórios
+não selecionados, `etapa` não faz nada além de um teste de None. Quando ativo,
+gera em `<diretório>/<dono>/<repo>/` (pelo full_name, já que o nome curto se
+repete entre donos):
+
+- `<etapa>.pstats`: profiling determinístico (cProfile), para pstats/snakeviz;
+- `<etapa>.collapsed`: pilhas amostradas no formato "f1;f2;f3 N", para flamegraph.pl/speedscope;
+- `resumo.txt`: tempo de parede por etapa e as funções mais caras.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Optional
+
+_config = None
+_repo_atual = None
+_lock = threading.Lock()
+_stats = {}
+_amostras = defaultdict(Counter)
+_tempos = Counter()
+_cprofile_ativo = False
+
+
+def configura(diretorio: Path, repos: Optional[Iterable[str]] = None, top: int = 25,
+              modo: str = "ambos", intervalo: float = 0.005):
+    """Ativa o profiling neste processo. `repos` (full_names) vazio ou None seleciona todos os repositórios."""
+    global _config
+    _config = {
+        "diretorio": Path(diretorio),
+        "repos": set(repos or []),
+        "top": top,
+        "cprofile": modo in ("cprofile", "ambos"),
+        "amostragem": modo in ("amostragem", "ambos"),
+        "intervalo": intervalo,
+    }
+
+
+def inicia_repo(full_name: str):
+    global _repo_atual
+    if _config is not None and (not _config["repos"] or full_name in _config["repos"]):
+        _repo_atual = full_name
+
+
+def _amostrador(thread_id: int, contador: Counter, parar: threading.Event, intervalo: float):
+    while not parar.wait(intervalo):
+        frame = sys._current_frames().get(thread_id)
+        pilha = []
+        while frame is not None:
+            codigo = frame.f_code
+            pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+            frame = frame.f_back
+        if pilha:
+            contador[";".join(reversed(pilha))] += 1
+
+
+@contextmanager
+def etapa(nome: str):
+    """Mede a etapa `nome` do repositório atual, se ele estiver selecionado."""
+    if _repo_atual is None:
+        yield
+        return
+
+    global _cprofile_ativo
+    profiler = None
+    with _lock:
+        # Só um cProfile pode estar ativo por vez (etapas aninhadas ou em threads paralelas
+        # ficam apenas com tempo e amostragem)
+        if _config["cprofile"] and not _cprofile_ativo:
+            profiler = cProfile.Profile()
+            _cprofile_ativo = True
+    amostras, parar, amostrador = Counter(), threading.Event(), None
+    if _config["amostragem"]:
+        amostrador = threading.Thread(
+            target=_amostrador, args=(threading.get_ident(), amostras, parar, _config["intervalo"]), daemon=True
+        )
+        amostrador.start()
+
+    inicio = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            _cprofile_ativo = False
+        duracao = time.perf_counter() - inicio
+        if amostrador:
+            parar.set()
+            amostrador.join()
+        with _lock:
+            _tempos[nome] += duracao
+            _amostras[nome].update(amostras)
+            if profiler:
+                if nome in _stats:
+                    _stats[nome].add(profiler)
+                else:
+                    _stats[nome] = pstats.Stats(profiler)
+
+
+def finaliza_repo():
+    """Grava os arquivos do repositório atual, imprime o resumo e limpa o estado."""
+    global _repo_atual
+    if _repo_atual is None:
+        return
+
+    destino = _config["diretorio"] / _repo_atual
+    destino.mkdir(parents=True, exist_ok=True)
+    resumo = io.StringIO()
+    resumo.write(f"Profiling de {_repo_atual}\n\nTempo de parede por etapa:\n")
+    for nome, duracao in _tempos.most_common():
+        resumo.write(f"  {nome:<20} {duracao:10.3f}s\n")
+
+    for nome, stats in _stats.items():
+        stats.dump_stats(str(destino / f"{nome}.pstats"))
+        resumo.write(f"\n--- {nome}: {_config['top']} funções com maior tempo próprio ---\n")
+        stats.stream = resumo
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(_config["top"])
+
+    for nome, amostras in _amostras.items():
+        if amostras:
+            with open(destino / f"{nome}.collapsed", "w") as arquivo:
+                for pilha, total in amostras.most_common():
+                    arquivo.write(f"{pilha} {total}\n")
+
+    (destino / "resumo.txt").write_text(resumo.getvalue())
+    print(f"  Profiling de {_repo_atual} salvo em: {destino}")
+    for nome, duracao in _tempos.most_common():
+        print(f"    {nome:<20} {duracao:8.3f}s")
+
+    _repo_atual = None
+    _stats.clear()
+    _amostras.clear()
+    _tempos.clear()
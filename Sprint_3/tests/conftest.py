@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Os módulos do Sprint_3 são scripts soltos, sem pacote
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
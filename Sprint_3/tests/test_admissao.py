@@ -0,0 +1,50 @@
+import pytest
+
+import admissao
+
+
+def test_job_que_nunca_cabe_falha(tmp_path):
+    conn = admissao.conecta(tmp_path / "admissao.sqlite")
+    enorme = admissao.disco_livre_mb(tmp_path) + 10 * 2**20
+    with pytest.raises(admissao.RecursosInsuficientes):
+        admissao.tenta_admitir(conn, tmp_path, "w0", "clone", enorme, 0, 0, 0)
+    assert conn.execute("SELECT COUNT(*) FROM reservas").fetchone()[0] == 0
+
+
+def test_job_que_so_invade_a_margem_e_admitido_quando_sozinho(tmp_path):
+    conn = admissao.conecta(tmp_path / "admissao.sqlite")
+    quase_tudo = admissao.disco_livre_mb(tmp_path) / 2
+    margem = admissao.disco_livre_mb(tmp_path)
+    assert admissao.tenta_admitir(conn, tmp_path, "w0", "clone", quase_tudo, 0, margem, 0)
+    # Com outro worker segurando recursos, o mesmo pedido espera
+    assert not admissao.tenta_admitir(conn, tmp_path, "w1", "clone", quase_tudo, 0, margem, 0)
+
+
+def test_cks_paralelos_do_mesmo_worker_dividem_o_orcamento(tmp_path, monkeypatch):
+    monkeypatch.setattr(admissao, "ram_disponivel_mb", lambda: 10000)
+    conn = admissao.conecta(tmp_path / "admissao.sqlite")
+    assert admissao.tenta_admitir(conn, tmp_path, "w0", "clone", 1, 256, 0, 0)
+    assert admissao.tenta_admitir(conn, tmp_path, "w0", "ck:0", 0, 8000, 0, 0)
+    # O CK irmão espera o primeiro terminar, em vez de estourar a memória
+    assert not admissao.tenta_admitir(conn, tmp_path, "w0", "ck:1", 0, 8000, 0, 0)
+    admissao.libera(conn, "w0", "ck:0")
+    # O clone do próprio worker não é liberado enquanto o CK espera: não bloqueia a admissão
+    assert admissao.tenta_admitir(conn, tmp_path, "w0", "ck:1", 0, 9900, 0, 0)
+
+
+def test_workers_esperando_a_jvm_nao_se_bloqueiam_pelo_clone(tmp_path, monkeypatch):
+    monkeypatch.setattr(admissao, "ram_disponivel_mb", lambda: 5000)
+    conn = admissao.conecta(tmp_path / "admissao.sqlite")
+    for worker in ("w0", "w1"):
+        assert admissao.tenta_admitir(conn, tmp_path, worker, "clone", 1, 256, 0, 0)
+    # Com a RAM dos dois clones reservada, cada CK esperaria pelo clone do outro
+    assert not admissao.tenta_admitir(conn, tmp_path, "w0", "ck", 0, 3700, 2048, 1024)
+    assert not admissao.tenta_admitir(conn, tmp_path, "w1", "ck", 0, 3700, 2048, 1024)
+
+    # Terminado o git clone, cada worker fica só com o disco do checkout
+    for worker in ("w0", "w1"):
+        admissao.libera_ram(conn, worker, "clone")
+    assert admissao.tenta_admitir(conn, tmp_path, "w0", "ck", 0, 3700, 2048, 1024)
+    assert not admissao.tenta_admitir(conn, tmp_path, "w1", "ck", 0, 3700, 2048, 1024)
+    admissao.libera(conn, "w0", "ck")
+    assert admissao.tenta_admitir(conn, tmp_path, "w1", "ck", 0, 3700, 2048, 1024)
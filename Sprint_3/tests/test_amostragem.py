@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import amostragem
+
+
+def _repos(total):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "stars_count": rng.lognormal(8, 1, total),
+        "disk_usage_kb": rng.lognormal(9, 1.5, total),
+    })
+
+
+@pytest.mark.parametrize("n", [1, 5, 15, 16, 17, 60, 399])
+def test_amostra_tem_exatamente_n_repositorios(n):
+    amostra = amostragem.amostra_estratificada(_repos(400), n)
+    assert len(amostra) == n
+    assert amostra.index.is_monotonic_increasing and amostra.index.is_unique
+
+
+def test_amostra_menor_que_numero_de_estratos_fica_com_os_maiores():
+    repos = _repos(400)
+    rotulos = amostragem.estratos(repos)
+    amostra = amostragem.amostra_estratificada(repos, 5)
+    assert set(rotulos[amostra.index]) == set(rotulos.value_counts().index[:5])
+
+
+def test_amostra_cobre_todos_os_estratos_quando_ha_vagas():
+    repos = _repos(400)
+    rotulos = amostragem.estratos(repos)
+    amostra = amostragem.amostra_estratificada(repos, 40)
+    assert set(rotulos[amostra.index]) == set(rotulos)
@@ -0,0 +1,39 @@
+import cache_ck
+
+MANIFEST = [("src/a/A.java", "sha-a"), ("src/a/B.java", "sha-b"), ("src/c/C.java", "sha-c")]
+
+
+def test_hash_arvore_nao_depende_da_ordem():
+    assert cache_ck.hash_arvore(MANIFEST) == cache_ck.hash_arvore(list(reversed(MANIFEST)))
+
+
+def test_hash_arvore_muda_com_conteudo_ou_caminho():
+    original = cache_ck.hash_arvore(MANIFEST)
+    alterado = [("src/a/A.java", "sha-a2")] + MANIFEST[1:]
+    movido = [("src/b/A.java", "sha-a")] + MANIFEST[1:]
+    assert len({original, cache_ck.hash_arvore(alterado), cache_ck.hash_arvore(movido)}) == 3
+
+
+def test_diff_manifests():
+    atual = [("src/a/A.java", "sha-a2"), ("src/a/B.java", "sha-b"), ("src/d/D.java", "sha-d")]
+    alterados, removidos = cache_ck.diff_manifests(MANIFEST, atual)
+    assert alterados == ["src/a/A.java", "src/d/D.java"]
+    assert removidos == ["src/c/C.java"]
+
+
+def test_blobs_gravados_e_lidos_por_sha(tmp_path):
+    conn = cache_ck.conecta(tmp_path / "cache.sqlite")
+    cache_ck.salva_blobs(conn, {"sha-a": {"classes": [{"class": "A", "cbo": 1}], "metodos": []}})
+    assert cache_ck.busca_blobs(conn, ["sha-a", "sha-x"]) == {
+        "sha-a": {"classes": [{"class": "A", "cbo": 1}], "metodos": []}
+    }
+
+
+def test_linhas_por_repositorio_substituidas_a_cada_analise(tmp_path):
+    conn = cache_ck.conecta(tmp_path / "cache.sqlite")
+    linhas = {"sha": "sha-a", "classes": [{"class": "A", "cbo": 1}], "metodos": []}
+    cache_ck.salva_arquivos_repo(conn, "dono/Java", {"src/a/A.java": linhas, "src/a/B.java": dict(linhas, sha="sha-b")})
+    cache_ck.salva_arquivos_repo(conn, "outro/Java", {"src/a/A.java": dict(linhas, sha="sha-fork")})
+    cache_ck.salva_arquivos_repo(conn, "dono/Java", {"src/a/A.java": linhas})
+    assert cache_ck.busca_arquivos_repo(conn, "dono/Java") == {"src/a/A.java": linhas}
+    assert cache_ck.busca_arquivos_repo(conn, "outro/Java")["src/a/A.java"]["sha"] == "sha-fork"
@@ -0,0 +1,133 @@
+import multiprocessing
+import sqlite3
+
+import pytest
+
+import fila_trabalho
+
+# Nomes curtos repetidos entre donos, como em 'repos.csv'
+REPOS_REPETIDOS = [
+    ("TheAlgorithms/Java", "Java"),
+    ("DuGuQiuBai/Java", "Java"),
+    ("HelloWorld521/Java", "Java"),
+    ("alibaba/druid", "druid"),
+    ("apache/druid", "druid"),
+]
+
+
+def _repos(total_unicos=35):
+    repos = [(f"dono{i}/repo{i}", f"repo{i}") for i in range(total_unicos)] + REPOS_REPETIDOS
+    return [
+        {"full_name": full_name, "repo_name": repo_name, "url": f"https://github.com/{full_name}"}
+        for full_name, repo_name in repos
+    ]
+
+
+def _worker(db_path, worker, concluidos):
+    conn = fila_trabalho.conecta(db_path)
+    while True:
+        tarefa = fila_trabalho.reserva_proxima(conn, worker, lease=600)
+        if tarefa is None:
+            break
+        metricas = {"repositorio": tarefa["repo_name"], "cbo_total": len(tarefa["full_name"])}
+        assert fila_trabalho.conclui(conn, tarefa["full_name"], worker, metricas)
+        concluidos.put(tarefa["full_name"])
+    conn.close()
+
+
+def test_nomes_curtos_repetidos_viram_tarefas_distintas(tmp_path):
+    conn = fila_trabalho.conecta(tmp_path / "fila.sqlite")
+    assert fila_trabalho.enfileira_repos(conn, _repos(0)) == len(REPOS_REPETIDOS)
+    # Reenfileirar não duplica nada
+    assert fila_trabalho.enfileira_repos(conn, _repos(0)) == 0
+    assert fila_trabalho.resumo(conn) == {fila_trabalho.PENDENTE: len(REPOS_REPETIDOS)}
+
+
+def test_fila_drenada_por_varios_processos(tmp_path):
+    db_path = tmp_path / "fila.sqlite"
+    repos = _repos()
+    conn = fila_trabalho.conecta(db_path)
+    fila_trabalho.enfileira_repos(conn, repos)
+
+    concluidos = multiprocessing.Queue()
+    processos = [
+        multiprocessing.Process(target=_worker, args=(db_path, f"w{i}", concluidos)) for i in range(4)
+    ]
+    for p in processos:
+        p.start()
+    # Cada tarefa é entregue a exatamente um worker
+    entregues = [concluidos.get(timeout=60) for _ in repos]
+    for p in processos:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+
+    assert sorted(entregues) == sorted(r["full_name"] for r in repos)
+    assert fila_trabalho.resumo(conn) == {fila_trabalho.CONCLUIDO: len(repos)}
+
+    resultados = fila_trabalho.exporta_resultados(conn)
+    assert [r["full_name"] for r in resultados] == [r["full_name"] for r in repos]
+    por_nome = {r["full_name"]: r for r in resultados}
+    assert por_nome["DuGuQiuBai/Java"]["repositorio"] == "Java"
+    assert por_nome["DuGuQiuBai/Java"]["cbo_total"] == len("DuGuQiuBai/Java")
+    assert por_nome["apache/druid"]["cbo_total"] == len("apache/druid")
+
+
+def test_lease_expirado_descarta_resultado_do_worker_antigo(tmp_path):
+    conn = fila_trabalho.conecta(tmp_path / "fila.sqlite")
+    fila_trabalho.enfileira_repos(conn, _repos(0)[:1])
+
+    tarefa = fila_trabalho.reserva_proxima(conn, "a", lease=-1)
+    assert fila_trabalho.reserva_proxima(conn, "b")["full_name"] == tarefa["full_name"]
+    assert not fila_trabalho.renova_lease(conn, tarefa["full_name"], "a")
+    assert not fila_trabalho.conclui(conn, tarefa["full_name"], "a", {})
+    assert fila_trabalho.conclui(conn, tarefa["full_name"], "b", {})
+
+
+def test_migra_fila_indexada_pelo_nome_curto(tmp_path):
+    db_path = tmp_path / "fila.sqlite"
+    antiga = sqlite3.connect(str(db_path))
+    antiga.executescript("""
+        CREATE TABLE tarefas (repo_name TEXT PRIMARY KEY, full_name TEXT, url TEXT NOT NULL, tamanho_kb REAL,
+            status TEXT NOT NULL DEFAULT 'pendente', tentativas INTEGER NOT NULL DEFAULT 0, worker TEXT,
+            lease_expira REAL, erro_classe TEXT, erro_mensagem TEXT, atualizado_em REAL);
+        CREATE TABLE resultados (repo_name TEXT PRIMARY KEY, metricas TEXT NOT NULL, worker TEXT, concluido_em REAL);
+        INSERT INTO tarefas (repo_name, full_name, url, status) VALUES ('Java', 'TheAlgorithms/Java', 'u', 'concluido');
+        INSERT INTO resultados VALUES ('Java', '{"cbo_total": 1}', 'w', 0);
+    """)
+    antiga.close()
+
+    conn = fila_trabalho.conecta(db_path)
+    assert fila_trabalho.busca_resultado(conn, "TheAlgorithms/Java") == {"cbo_total": 1}
+    # O homônimo que a chave antiga descartava agora entra na fila
+    assert fila_trabalho.enfileira_repos(conn, _repos(0)) == len(REPOS_REPETIDOS) - 1
+
+
+def test_em_aberto_considera_falhas_e_reabertos_como_finalizados(tmp_path):
+    conn = fila_trabalho.conecta(tmp_path / "fila.sqlite")
+    repos = _repos(0)
+    fila_trabalho.enfileira_repos(conn, repos[:3])
+
+    concluido = fila_trabalho.reserva_proxima(conn, "w")
+    fila_trabalho.conclui(conn, concluido["full_name"], "w", {})
+    falha = fila_trabalho.reserva_proxima(conn, "w")
+    fila_trabalho.registra_falha(conn, falha["full_name"], "w", "ErroCK")
+    fila_trabalho.reabre_concluidos(conn)
+
+    nomes = [r["full_name"] for r in repos]
+    # O terceiro ainda está pendente e os dois últimos nunca foram enfileirados
+    assert fila_trabalho.em_aberto(conn, nomes) == nomes[2:]
+
+
+def test_conexao_de_leitura_nao_altera_a_fila(tmp_path):
+    db_path = tmp_path / "fila.sqlite"
+    conn = fila_trabalho.conecta(db_path)
+    fila_trabalho.enfileira_repos(conn, _repos(0))
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+
+    conn = fila_trabalho.conecta_leitura(db_path)
+    assert len(fila_trabalho.em_aberto(conn, ["TheAlgorithms/Java", "dono/novo"])) == 2
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM tarefas")
+    conn.close()
+    assert sqlite3.connect(db_path).execute("PRAGMA journal_mode").fetchone()[0] == "delete"
@@ -0,0 +1,161 @@
+import argparse
+import importlib
+import os
+import tempfile
+
+import pandas as pd
+
+# config.py exige estas variáveis; nenhum teste clona repositórios nem roda o CK de verdade
+_TMP = tempfile.mkdtemp()
+for _var in ("PATH_REPOSITORIES", "PATH_OUTPUT_CK", "PATH_CK_JAR", "JAVA_PATH"):
+    os.environ.setdefault(_var, os.path.join(_TMP, _var.lower()))
+os.environ.setdefault("GITHUB_TOKEN", "teste")
+
+import cache_ck  # noqa: E402
+
+analises = importlib.import_module("2_geracao_analises")
+
+FONTE = "class X {}\n"
+ARGS = argparse.Namespace(heap_max_mb=1024, ck_sem_progresso=60, ck_prazo_max=60)
+
+
+def _repo(tmp_path, caminhos):
+    path_repo = tmp_path / "repo"
+    for caminho in caminhos:
+        (path_repo / caminho).parent.mkdir(parents=True, exist_ok=True)
+        (path_repo / caminho).write_text(FONTE)
+    return path_repo
+
+
+def _escreve_saida_ck(output_dir, arquivos, cbo):
+    """Grava 'class.csv' e 'method.csv' como o CK, com caminhos absolutos."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame([
+        {"file": str(f), "class": f.stem, "cbo": cbo, "dit": 1, "lcom": 0, "loc": 1} for f in arquivos
+    ]).to_csv(output_dir / "class.csv", index=False)
+    pd.DataFrame([
+        {"file": str(f), "class": f.stem, "method": "m/0", "loc": 1} for f in arquivos
+    ]).to_csv(output_dir / "method.csv", index=False)
+
+
+def _ck_falso(enviados):
+    """Substitui o CK: registra os arquivos recebidos e gera CBO 7 para todos."""
+    def run_ck_analysis(ck_root, output_dir, heap_mb=None, java_files=None, **_):
+        enviados.extend(f.relative_to(ck_root).as_posix() for f in java_files)
+        _escreve_saida_ck(output_dir, java_files, cbo=7)
+        return True
+    return run_ck_analysis
+
+
+def _linhas(cbo):
+    return {"classes": [{"class": "X", "cbo": cbo, "dit": 1, "lcom": 0, "loc": 1}],
+            "metodos": [{"class": "X", "method": "m/0", "loc": 1}]}
+
+
+def test_merge_atribui_linhas_novas_e_reaproveitadas_aos_caminhos_do_repo(tmp_path):
+    path_repo = _repo(tmp_path, ["a/X.java", "b/X.java"])
+    ck_root, output_dir = tmp_path / "staging", tmp_path / "saida"
+    _escreve_saida_ck(output_dir, [ck_root / "a/X.java"], cbo=7)
+    conn = cache_ck.conecta(tmp_path / "cache.sqlite")
+    manifest = [("a/X.java", "sha-novo"), ("b/X.java", "sha-antigo"), ("b/package-info.java", "sha-info")]
+
+    analises.merge_ck_rows(path_repo, ck_root, output_dir, manifest, {"b/X.java": _linhas(1)}, conn)
+
+    classes = pd.read_csv(output_dir / "class.csv")
+    assert dict(zip(classes["file"], classes["cbo"])) == {
+        str(path_repo / "a/X.java"): 7, str(path_repo / "b/X.java"): 1
+    }
+    assert len(pd.read_csv(output_dir / "method.csv")) == 2
+    # Só as linhas que passaram pelo CK entram no cache; arquivo sem classes conta como analisado
+    cache = cache_ck.busca_blobs(conn, ["sha-novo", "sha-antigo", "sha-info"])
+    assert set(cache) == {"sha-novo", "sha-info"}
+    assert cache["sha-novo"]["classes"][0]["cbo"] == 7
+    assert cache["sha-info"] == {"classes": [], "metodos": []}
+
+
+def test_blob_repetido_reanalisado_em_um_so_caminho_chega_ao_ck(tmp_path, monkeypatch):
+    # O mesmo conteúdo em dois pacotes: 'a/X.java' precisa voltar ao CK, 'b/X.java' vem do cache
+    path_repo = _repo(tmp_path, ["a/X.java", "b/X.java", "c/Y.java"])
+    manifest = [("a/X.java", "sha-x"), ("b/X.java", "sha-x"), ("c/Y.java", "sha-y")]
+    conn = cache_ck.conecta(tmp_path / "cache.sqlite")
+    cache_ck.salva_blobs(conn, {"sha-x": _linhas(1), "sha-y": _linhas(2)})
+
+    enviados = []
+    ck_falso = _ck_falso(enviados)
+
+    monkeypatch.setattr(analises, "run_ck_analysis", ck_falso)
+    monkeypatch.setattr(analises, "affected_files", lambda *_: {"a/X.java"})
+    output_dir = tmp_path / "saida"
+    metricas = analises.analyze_checkout(path_repo, "repo", tmp_path / "staging", output_dir, ARGS, "w0",
+                                         conn_cache=conn, manifest=manifest, reaproveitar_blobs=True)
+
+    assert enviados == ["a/X.java"]
+    classes = pd.read_csv(output_dir / "class.csv")
+    assert dict(zip(classes["file"], classes["cbo"])) == {
+        str(path_repo / "a/X.java"): 7, str(path_repo / "b/X.java"): 1, str(path_repo / "c/Y.java"): 2
+    }
+    assert metricas["arquivos_java"] == 3
+
+
+def _repo_java(tmp_path, fontes):
+    path_repo = tmp_path / "repo"
+    for caminho, fonte in fontes.items():
+        (path_repo / caminho).parent.mkdir(parents=True, exist_ok=True)
+        (path_repo / caminho).write_text(fonte)
+    return path_repo, [(caminho, f"sha-{caminho}") for caminho in fontes]
+
+
+FONTES_HIERARQUIA = {
+    "base/Raiz.java": "package base;\npublic class Raiz {}\n",
+    "base/Meio.java": "package base;\npublic class Meio extends Raiz {}\n",
+    "app/Folha.java": "package app;\nimport base.Meio;\npublic class Folha extends Meio {}\n",
+    "app/Neta.java": "package app;\npublic class Neta extends Folha {}\n",
+    "app/Usa.java": "package app;\nimport base.*;\nclass Usa { Raiz r; }\n",
+    "app/Outra.java": "package app;\nclass Outra {}\n",
+    "util/Solta.java": "package util;\n// Raiz só no comentário\nclass Solta { String s = \"Meio\"; }\n",
+}
+
+
+def test_afetados_incluem_dependentes_subclasses_e_supertipos_de_outros_pacotes(tmp_path):
+    path_repo, manifest = _repo_java(tmp_path, FONTES_HIERARQUIA)
+    afetados = analises.affected_files(path_repo, manifest, ["base/Raiz.java"], [])
+    # Subclasses em qualquer nível e quem cita o tipo voltam ao CK, com o pacote deles;
+    # comentários e literais não contam como uso
+    assert afetados == {"base/Raiz.java", "base/Meio.java", "app/Folha.java", "app/Neta.java",
+                        "app/Usa.java", "app/Outra.java"}
+
+    # Um arquivo alterado leva junto a cadeia de supertipos, mesmo de outro pacote
+    afetados = analises.affected_files(path_repo, manifest, ["app/Neta.java"], [])
+    assert {"app/Folha.java", "base/Meio.java", "base/Raiz.java"} <= afetados
+    assert "util/Solta.java" not in afetados
+
+
+def test_afetados_por_tipo_removido(tmp_path):
+    path_repo, manifest = _repo_java(tmp_path, {
+        "a/Usa.java": "package a;\nimport b.Sumiu;\nclass Usa { Sumiu s; }\n",
+        "c/Nada.java": "package c;\nclass Nada {}\n",
+    })
+    assert analises.affected_files(path_repo, manifest, [], ["b/Sumiu.java"]) == {"a/Usa.java"}
+
+
+def test_atualizacao_usa_as_linhas_do_proprio_repositorio(tmp_path, monkeypatch):
+    path_repo, manifest = _repo_java(tmp_path, FONTES_HIERARQUIA)
+    conn = cache_ck.conecta(tmp_path / "cache.sqlite")
+    # Um fork com o mesmo blob gravou outras métricas no cache global
+    cache_ck.salva_blobs(conn, {sha: _linhas(99) for _, sha in manifest})
+    anteriores = {caminho: dict(_linhas(1), sha=sha) for caminho, sha in manifest}
+    anteriores["util/Solta.java"]["sha"] = "sha-antigo"
+
+    enviados = []
+    monkeypatch.setattr(analises, "run_ck_analysis", _ck_falso(enviados))
+    output_dir = tmp_path / "saida"
+    analises.analyze_checkout(path_repo, "repo", tmp_path / "staging", output_dir, ARGS, "w0",
+                              conn_cache=conn, manifest=manifest, full_name="dono/repo", anteriores=anteriores)
+
+    assert enviados == ["util/Solta.java"]
+    classes = pd.read_csv(output_dir / "class.csv")
+    assert sorted(classes["cbo"]) == [1] * 6 + [7]
+    # As linhas desta análise ficam guardadas para a próxima atualização
+    guardadas = cache_ck.busca_arquivos_repo(conn, "dono/repo")
+    assert guardadas["util/Solta.java"]["sha"] == "sha-util/Solta.java"
+    assert guardadas["util/Solta.java"]["classes"][0]["cbo"] == 7